@@ -16,7 +16,8 @@ from copy import deepcopy
 
 from parseCmsRunSummary import parse_and_dump
 from treeSizeReport import produce_size_json
-from dumpNtuple import flatten_ntuple_write
+from dumpNtuple import flatten_ntuple_write, write_tree_schema
+from refCache import RefCache, get_cache_key, get_dumper_version, get_git_commit
 
 
 NEVENTS = 500
@@ -342,8 +343,24 @@ if __name__ == "__main__":
     parser.add_argument("--year", required=True, help="Year of config to run e.g. 2018, 2016v2")
     parser.add_argument("--isData", action='store_true', help="Use if running over data")
     parser.add_argument("--append", type=str, help="Optional append to add to Ntuple & log files", default="")
+    parser.add_argument("--jobs", type=int, help="Number of processes to use when dumping Ntuple data", default=1)
+    parser.add_argument("--classCacheDir", help="Directory to cache class info when dumping Ntuple data", default=None)
+    parser.add_argument("--profileDump", action='store_true', help="Save time spent on each method when dumping Ntuple data")
+    parser.add_argument("--refCacheDir", help="Directory of cache to reuse outputs from previous identical jobs. "
+                                              "Only use for reference jobs", default=None)
+    parser.add_argument("--refCacheMaxSize", type=float, help="Maximum size of cache [GB]", default=20)
+    parser.add_argument("--refCommit", help="Commit of reference code, for the cache. "
+                                            "Defaults to HEAD of $CMSSW_BASE/src/UHH2", default=None)
     args = parser.parse_args()
 
+    ref_cache, ref_commit = None, None
+    if args.refCacheDir:
+        ref_commit = args.refCommit or get_git_commit(os.path.expandvars("${CMSSW_BASE}/src/UHH2"))
+        if ref_commit is None:
+            print("! Cannot determine reference commit, not using cache")
+        else:
+            ref_cache = RefCache(args.refCacheDir, max_size=int(args.refCacheMaxSize * 1.0E9))
+
     year_dict = CONFIGS.get(args.year, None)
     if year_dict is None:
         raise KeyError("Cannot find entry in dictionary with year argument %s" % args.year)
@@ -361,13 +378,6 @@ if __name__ == "__main__":
         if "name" not in job:
             raise RuntimeError("No 'name' key, you must specify a name")
 
-        # First copy the file across from EOS to avoid XROOTD errors
-        cp_cmd = "source ${{CI_PROJECT_DIR}}/scripts/fetchMiniAOD.sh {inputfile}".format(**job)
-        fetch_return_code = subprocess.call(cp_cmd, shell=True)
-        if fetch_return_code != 0:
-            sys.exit(fetch_return_code)
-
-        # Now run the actual cmsRun command
         append = "%s_%s_%s%s" % (type_str, args.year, job['name'], args.append)
 
         cms_dict = deepcopy(job)
@@ -388,6 +398,47 @@ if __name__ == "__main__":
             print("! Cannot find config file", config_filepath, "skipping")
             continue
 
+        tree_name = "AnalysisTree"
+        timing_json = "timing_%s.json" % (append)
+        size_json = "size_%s.json" % (append)
+        data_output = "data_%s.awkd" % (append)
+        schema_json = "schema_%s.json" % (append)
+        output_files = {
+            "ntuple": cms_dict['outputfile'],
+            "log": cms_dict['logfile'],
+            "timing": timing_json,
+            "size": size_json,
+            "data": data_output,
+            "schema": schema_json,
+        }
+        profile_json = None
+        if args.profileDump:
+            # Also cached, so a cache hit still gives the profile.
+            # Entries stored without it are not reused.
+            profile_json = "dumpprofile_%s.json" % (append)
+            output_files["profile"] = profile_json
+
+        # Reuse outputs from a previous identical job if possible
+        cache_key, cache_key_info = None, None
+        if ref_cache is not None:
+            cache_key_info = dict(ref_commit=ref_commit, config=cms_dict['config'],
+                                  input_file=job['inputfile'], max_events=cms_dict['maxevents'],
+                                  dumper_version=get_dumper_version(),
+                                  cmssw_version=os.environ.get('CMSSW_VERSION'),
+                                  scram_arch=os.environ.get('SCRAM_ARCH'),
+                                  cmdlineopt=cms_dict['cmdlineopt'], numthreads=cms_dict['numthreads'])
+            cache_key = get_cache_key(**cache_key_info)
+            if ref_cache.restore(cache_key, output_files):
+                print("Reusing cached outputs for", append, "from", args.refCacheDir, "key", cache_key)
+                continue
+
+        # First copy the file across from EOS to avoid XROOTD errors
+        cp_cmd = "source ${{CI_PROJECT_DIR}}/scripts/fetchMiniAOD.sh {inputfile}".format(**job)
+        fetch_return_code = subprocess.call(cp_cmd, shell=True)
+        if fetch_return_code != 0:
+            sys.exit(fetch_return_code)
+
+        # Now run the actual cmsRun command
         # Use tee to pipe to file & stdout simultaneously for monitoring
         # set -o pipefail VITAL to ensure error code passed through tee,
         # otherwise will use exit code from tee (0) not cmsRun
@@ -400,17 +451,23 @@ if __name__ == "__main__":
             sys.exit(return_code)
 
         # Parse logfile to JSON
-        timing_json = "timing_%s.json" % (append)
         parse_and_dump(cms_dict['logfile'], timing_json)
 
         # Dump branch sizes to JSON
-        size_json = "size_%s.json" % (append)
-        tree_name = "AnalysisTree"
         produce_size_json(cms_dict['outputfile'], size_json, tree_name=tree_name, verbose=False)
 
+        # Dump collections & methods in tree, for a quick structural comparison
+        write_tree_schema(input_filename=cms_dict['outputfile'], tree_name=tree_name,
+                          output_filename=schema_json, class_cache_dir=args.classCacheDir)
+
         # Dump data to JSON
-        data_output = "data_%s.awkd" % (append)
         flatten_ntuple_write(input_filename=cms_dict['outputfile'], tree_name=tree_name,
-                             output_filename=data_output)
+                             output_filename=data_output, n_jobs=args.jobs,
+                             class_cache_dir=args.classCacheDir,
+                             profile_filename=profile_json)
+
+        if ref_cache is not None:
+            ref_cache.store(cache_key, output_files, key_info=cache_key_info)
+            print("Stored outputs for", append, "in", args.refCacheDir, "key", cache_key)
 
     sys.exit(0)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+
+"""Streaming summary statistics for the columns in a tree dump.
+
+Statistics are accumulated chunk by chunk while dumping, so that comparisons
+that only need e.g. the mean & RMS do not have to reload the full data.
+They are stored in a small JSON "sidecar" file next to the dump,
+see get_summary_filename().
+"""
+
+
+from __future__ import print_function
+
+import os
+import json
+import hashlib
+import numpy as np
+
+
+SUMMARY_VERSION = 2
+
+# The sketch is a histogram with fixed bins, so sketches from different dumps
+# can be compared bin-by-bin, and chunks can be merged by adding counts.
+# Bins are log-spaced in |x|, SKETCH_BINS_PER_DECADE per decade
+# between 10^SKETCH_MIN_EXP and 10^SKETCH_MAX_EXP, for both signs,
+# plus a bin for values with smaller magnitude & 2 overflow bins.
+SKETCH_MIN_EXP = -8
+SKETCH_MAX_EXP = 12
+SKETCH_BINS_PER_DECADE = 4
+
+
+def get_sketch_edges():
+    """Get bin edges for the fixed-bin sketch
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    n_edges = (SKETCH_MAX_EXP - SKETCH_MIN_EXP) * SKETCH_BINS_PER_DECADE + 1
+    pos_edges = np.logspace(SKETCH_MIN_EXP, SKETCH_MAX_EXP, n_edges)
+    return np.concatenate([-pos_edges[::-1], pos_edges])
+
+
+SKETCH_EDGES = get_sketch_edges()
+
+
+def update_content_hash(hasher, values):
+    """Add a chunk of values to a content hash.
+
+    Bools & integers are hashed as int64, and floats as float64, so the hash
+    doesn't depend on their storage width (e.g. int32 vs int64), and integers
+    too large for a float64 are not rounded to the same value.
+    Hashing a column in chunks gives the same hash as hashing it in one go.
+
+    Parameters
+    ----------
+    hasher : hashlib hash object
+        Modified in-place
+    values : numpy.ndarray
+        Numbers, bools, or strings
+
+    Returns
+    -------
+    bool
+        True if values are strings
+    """
+    if values.dtype.kind not in 'biuf':
+        for v in values.tolist():
+            hasher.update((v if isinstance(v, bytes) else str(v).encode('utf-8')) + b'\0')
+        return True
+    if values.dtype.kind == 'f':
+        hasher.update(values.astype(np.float64).tobytes())
+    else:
+        # uint64 above the int64 range wraps around, but keeps distinct values distinct
+        hasher.update(values.astype(np.int64).tobytes())
+    return False
+
+
+def get_content_hash(values):
+    """Get content hash of a whole column, as for ColumnStats.content_hash
+
+    Parameters
+    ----------
+    values : numpy.ndarray, list
+
+    Returns
+    -------
+    str
+    """
+    hasher = hashlib.sha1()
+    values = np.asarray(values)
+    if len(values) > 0:
+        update_content_hash(hasher, values)
+    return hasher.hexdigest()
+
+
+class ColumnStats(object):
+
+    """Summary statistics for one column, updated one chunk at a time.
+
+    For numerical values, the mean & variance are only over finite values,
+    and are combined between chunks using Welford/Chan's method
+    to avoid loss of precision. NaN & inf values are counted separately.
+
+    The content hash depends on the values and their order,
+    but not their storage width (e.g. float vs double), see update_content_hash().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.n_finite = 0
+        self.n_nan = 0
+        self.n_inf = 0
+        self.mean = 0.
+        self.m2 = 0.  # sum of squared differences from the mean
+        self.min = None
+        self.max = None
+        self.sketch = np.zeros(len(SKETCH_EDGES) + 1, dtype=np.int64)
+        self.is_string = False
+        self._hash = hashlib.sha1()
+
+    def update(self, values):
+        """Add a chunk of values
+
+        Parameters
+        ----------
+        values : numpy.ndarray, list
+            Numbers, bools, or strings
+        """
+        values = np.asarray(values)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+
+        if update_content_hash(self._hash, values):
+            self.is_string = True
+            return
+
+        values = values.astype(np.float64)
+
+        is_nan = np.isnan(values)
+        is_inf = np.isinf(values)
+        self.n_nan += int(np.count_nonzero(is_nan))
+        self.n_inf += int(np.count_nonzero(is_inf))
+        finite = values[~(is_nan | is_inf)]
+        n_chunk = len(finite)
+        if n_chunk == 0:
+            return
+
+        mean_chunk = float(finite.mean())
+        m2_chunk = float(((finite - mean_chunk)**2).sum())
+        n_total = self.n_finite + n_chunk
+        delta = mean_chunk - self.mean
+        self.mean += delta * n_chunk / n_total
+        self.m2 += m2_chunk + delta**2 * self.n_finite * n_chunk / n_total
+        self.n_finite = n_total
+
+        chunk_min, chunk_max = float(finite.min()), float(finite.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+        bin_inds = np.searchsorted(SKETCH_EDGES, finite, side='right')
+        self.sketch += np.bincount(bin_inds, minlength=len(self.sketch))
+
+    @property
+    def variance(self):
+        """Population variance of finite values"""
+        return self.m2 / self.n_finite if self.n_finite else 0.
+
+    @property
+    def rms(self):
+        """Standard deviation of finite values, as in ROOT's TH1::GetRMS()"""
+        return self.variance ** 0.5
+
+    @property
+    def content_hash(self):
+        return self._hash.hexdigest()
+
+    def to_dict(self):
+        """Get statistics as dict of plain python types, e.g. for JSON"""
+        if self.is_string:
+            return {'count': self.count, 'is_string': True, 'hash': self.content_hash}
+        return {
+            'count': self.count,
+            'is_string': False,
+            'n_finite': self.n_finite,
+            'n_nan': self.n_nan,
+            'n_inf': self.n_inf,
+            'mean': self.mean,
+            'variance': self.variance,
+            'rms': self.rms,
+            'min': self.min,
+            'max': self.max,
+            'sketch': self.sketch.tolist(),
+            'hash': self.content_hash,
+        }
+
+
+def update_column_stats(all_stats, tree_data):
+    """Update statistics for each column with a chunk of dumped data.
+
+    Chunks must be added in entry order, for the content hashes to be reproducible.
+
+    Parameters
+    ----------
+    all_stats : dict[str, ColumnStats]
+        Modified in-place, new columns are added as necessary
+    tree_data : dict[str, ColumnAccumulator]
+        Values for each column
+    """
+    for key in tree_data:
+        if key not in all_stats:
+            all_stats[key] = ColumnStats()
+        all_stats[key].update(tree_data[key].to_numpy())
+
+
+def get_summary_filename(dump_filename):
+    """Get filename of summary sidecar file for a dump file,
+    e.g. data_new.awkd -> data_new.summary.json
+
+    Parameters
+    ----------
+    dump_filename : str
+
+    Returns
+    -------
+    str
+    """
+    return os.path.splitext(dump_filename)[0] + ".summary.json"
+
+
+def save_summary(all_stats, output_filename, n_entries=None, metadata=None):
+    """Save statistics for all columns to JSON file
+
+    Parameters
+    ----------
+    all_stats : dict[str, ColumnStats]
+    output_filename : str
+    n_entries : int, optional
+        Number of tree entries dumped
+    metadata : dict, optional
+        Info about the dump e.g. which entries were sampled
+    """
+    summary = {
+        'version': SUMMARY_VERSION,
+        'n_entries': n_entries,
+        'metadata': metadata or {},
+        'sketch_binning': {
+            'min_exp': SKETCH_MIN_EXP,
+            'max_exp': SKETCH_MAX_EXP,
+            'bins_per_decade': SKETCH_BINS_PER_DECADE,
+        },
+        'columns': {k: v.to_dict() for k, v in all_stats.items()},
+    }
+    with open(output_filename, 'w') as jf:
+        json.dump(summary, jf, indent=2, sort_keys=True)
+
+
+def load_summary(filename):
+    """Load summary from JSON file made by save_summary()
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    dict
+        Summary, statistics for each column are in summary['columns']
+
+    Raises
+    ------
+    IOError
+        If file is from an incompatible version
+    """
+    with open(filename) as jf:
+        summary = json.load(jf)
+    if summary.get('version') != SUMMARY_VERSION:
+        raise IOError("Summary file %s has version %s, need %s"
+                      % (filename, summary.get('version'), SUMMARY_VERSION))
+    return summary
@@ -15,6 +15,7 @@ from six import string_types
 import os
 import re
 import json
+import hashlib
 import argparse
 import numpy as np
 from array import array
@@ -22,6 +23,11 @@ from itertools import chain
 from collections import OrderedDict, Counter
 from tqdm import tqdm
 import ROOT
+from columnStats import ColumnStats, get_content_hash, get_summary_filename, load_summary
+from distributionMetrics import HistSummary, compare_distributions, analyse_metrics
+from refCache import RefCache
+from dumpReaders import open_dump
+from rootMemory import get_canvas, own_object, get_rss, format_rss, RSS_TRACE_INTERVAL
 
 
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -58,6 +64,48 @@ def get_collections(tree_data_keys):
     return collections
 
 
+def load_schema_methods(filename, tree_name="AnalysisTree"):
+    """Get list of chained methods from a tree schema JSON made by dumpNtuple.py --schemaOnly,
+    or directly from a ROOT ntuple (using the class info from the currently loaded libraries).
+    No entries are read.
+
+    Parameters
+    ----------
+    filename : str
+        JSON or ROOT filename
+    tree_name : str, optional
+        Name of TTree, only used for ROOT files
+
+    Returns
+    -------
+    list[str]
+    """
+    if os.path.splitext(filename)[1] == ".root":
+        from dumpNtuple import open_tree, parse_tree
+        f_in, tree = open_tree(filename, tree_name)
+        _, _, method_list = parse_tree(tree)
+        f_in.Close()
+        return method_list
+    with open(filename) as f:
+        return json.load(f)['method_list']
+
+
+def fill_hist(hist, values):
+    """Fill histogram with all values in one call, instead of calling Fill() for each.
+
+    Uses TH1::FillN(), so the bin contents, Sumw2, under/overflow, number of entries,
+    and stats (mean, RMS) are identical to calling Fill() for each value.
+
+    Parameters
+    ----------
+    hist : ROOT.TH1
+    values : numpy.ndarray
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if len(values) > 0:
+        hist.FillN(len(values), values, ROOT.nullptr)
+
+
 def make_hists_ROOT(data1, data2, method_str):
     """Create ROOT TH1s for data1 & data2.
     Also returns stats boxes, which are tricky to handle.
@@ -79,7 +127,7 @@ def make_hists_ROOT(data1, data2, method_str):
         Description
     """
     hname_clean = method_str.replace("()", "")
-    c = ROOT.TCanvas("ctmp"+hname_clean, "", 800, 600)
+    c = get_canvas("ctmp", 800, 600)
 
     nbins = 50
 
@@ -105,7 +153,7 @@ def make_hists_ROOT(data1, data2, method_str):
 
         if data1 is not None:
             h1name = "h1_%s" % (hname_clean)
-            h1 = ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax)
+            h1 = own_object(ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax))
             stats1 = None
             ax = h1.GetXaxis()
             ax.SetAlphanumeric()
@@ -117,12 +165,12 @@ def make_hists_ROOT(data1, data2, method_str):
             c.Update()
             # Get stat boxes for repositioning
             # Draw hist by itself to get it, then plot them together afterwards
-            stats1 = h1.GetListOfFunctions().FindObject("stats").Clone("stats1")
+            stats1 = own_object(h1.GetListOfFunctions().FindObject("stats").Clone("stats1"))
             h1.SetStats(0)
 
         if data2 is not None:
             h2name = "h2_%s" % (hname_clean)
-            h2 = ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax)
+            h2 = own_object(ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax))
             stats2 = None
             ax = h2.GetXaxis()
             ax.SetAlphanumeric()
@@ -132,10 +180,14 @@ def make_hists_ROOT(data1, data2, method_str):
                     h2.Fill(ind, counter2[val])
             h2.Draw("HIST")
             c.Update()
-            stats2 = h2.GetListOfFunctions().FindObject("stats").Clone("stats2")
+            stats2 = own_object(h2.GetListOfFunctions().FindObject("stats").Clone("stats2"))
             h2.SetStats(0)
-            c.Clear()
     else:
+        # Convert to arrays once, so we can find the range & fill without
+        # iterating in python
+        values1 = np.asarray(data1) if data1 is not None else None
+        values2 = np.asarray(data2) if data2 is not None else None
+
         # Figure out axis range using both hists is possible
         xmin, xmax = 0, 1
         if isinstance(data1_first_entry, type(None)) or isinstance(data2_first_entry, type(None)):
@@ -146,8 +198,13 @@ def make_hists_ROOT(data1, data2, method_str):
                 nbins = 2
             else:
                 try:
-                    xmin = min(chain(data1, data2))
-                    xmax = max(chain(data1, data2))
+                    all_values = np.concatenate([values1, values2])
+                    xmin = all_values.min()
+                    xmax = all_values.max()
+                    if np.isnan(xmin) or np.isnan(xmax):
+                        # numpy propagates NaN, so keep the previous behaviour of min/max
+                        xmin = min(chain(data1, data2))
+                        xmax = max(chain(data1, data2))
                     # add extra padding
                     delta = xmax - xmin
                     if delta == 0:
@@ -162,29 +219,28 @@ def make_hists_ROOT(data1, data2, method_str):
         # We make hists even if no data, to make further plotting easier
         if data1 is not None:
             h1name = "h1_%s" % (hname_clean)
-            h1 = ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax)
+            h1 = own_object(ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax))
             stats1 = None
-            for d in data1:
-                h1.Fill(d)
+            fill_hist(h1, values1)
             h1.Draw("HIST")
             c.Update()
             # Get stat boxes for repositioning
             # Draw hist by itself to get it, then plot them together afterwards
-            stats1 = h1.GetListOfFunctions().FindObject("stats").Clone("stats1")
+            stats1 = own_object(h1.GetListOfFunctions().FindObject("stats").Clone("stats1"))
             h1.SetStats(0)
 
         if data2 is not None:
             h2name = "h2_%s" % (hname_clean)
-            h2 = ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax)
+            h2 = own_object(ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax))
             stats2 = None
-            for d in data2:
-                h2.Fill(d)
+            fill_hist(h2, values2)
             h2.Draw("HIST")
             c.Update()
-            stats2 = h2.GetListOfFunctions().FindObject("stats").Clone("stats2")
+            stats2 = own_object(h2.GetListOfFunctions().FindObject("stats").Clone("stats2"))
             h2.SetStats(0)
 
-        c.Clear()
+    # Leave the canvas empty for reuse
+    c.Clear()
 
     return h1, stats1, h2, stats2
 
@@ -198,7 +254,7 @@ def get_xy(graph):
 
 def plot_hists_ROOT(h1, stats1, h2, stats2, output_dir=".",
                     canvas_size=(800, 600), fmt='pdf',
-                    prepend="", append="", make_thumbnail=False):
+                    prepend="", append="", make_thumbnail=False, thumbnail_only=False):
     """Make a (comparison) plot from histogram h1 + stats box stats1, and h2+stats2 and save to file.
 
     h1/stats1 or h2/stats2 can be None, in which case a simpler plot is made
@@ -232,6 +288,8 @@ def plot_hists_ROOT(h1, stats1, h2, stats2, output_dir=".",
         <append> in filename
     make_thumbnail : bool, optional
         If True, save additional copy as small gif in subdir "thumbnails"
+    thumbnail_only : bool, optional
+        If True, only save the thumbnail, not the full size plot
 
     """
     if not h1 and not h2:
@@ -239,7 +297,7 @@ def plot_hists_ROOT(h1, stats1, h2, stats2, output_dir=".",
         return
 
     hname = h1.GetName().replace("h1_", "") if h1 else h2.GetName().replace("h2_", "")
-    c = ROOT.TCanvas("c"+hname, "", *canvas_size)
+    c = get_canvas("cplot", *canvas_size)
     c.SetTicks(1, 1)
 
     # Check if our version of ROOT has TRatioPlot
@@ -264,10 +322,13 @@ def plot_hists_ROOT(h1, stats1, h2, stats2, output_dir=".",
         h2.SetMarkerSize(1.5)
 
     # Do final plotting
+    rp = None
     if do_ratioplot and h1 and h2:
         # Clone h1, since a bug in TRatioPlot will screw up h1
         # and change e.g. GetMean()
-        rp = ROOT.TRatioPlot(h1.Clone(ROOT.TUUID().AsString()), h2.Clone(ROOT.TUUID().AsString()))
+        h1_clone = own_object(h1.Clone(ROOT.TUUID().AsString()))
+        h2_clone = own_object(h2.Clone(ROOT.TUUID().AsString()))
+        rp = ROOT.TRatioPlot(h1_clone, h2_clone)
         rp.SetGridlines(array('d', [1.]), 1)
         # Set margins so that we can fit the stats box off the plot
         rp.SetLeftMargin(0.12)
@@ -369,46 +430,21 @@ def plot_hists_ROOT(h1, stats1, h2, stats2, output_dir=".",
 
     c.Modified()
 
-    output_filename = "%s%s%s.%s" % (prepend, hname, append, fmt)
-    output_name = os.path.join(output_dir, output_filename)
-    c.SaveAs(output_name)
+    if not thumbnail_only:
+        output_filename = "%s%s%s.%s" % (prepend, hname, append, fmt)
+        output_name = os.path.join(output_dir, output_filename)
+        c.SaveAs(output_name)
 
-    if make_thumbnail:
+    if make_thumbnail or thumbnail_only:
         c.SetCanvasSize(300, 200)
         output_filename = "%s%s%s.%s" % (prepend, hname, append, 'gif')
         output_name = os.path.join(output_dir, "thumbnails", output_filename)
         c.SaveAs(output_name)
 
-
-class HistSummary(object):
-
-    def __init__(self, name, description):
-        """Simple class to hold info about summary between 2 hists
-
-        Parameters
-        ----------
-        name : str
-            Classification of summary
-        description : str
-            Detailed description
-        """
-        self.name = name.upper().replace(" ", "_")
-        self.description = description
-
-    def __eq__(self, other):
-        return self.name == other.name
-
-    def __repr__(self):
-        return "HistSummary(%s, %s)" % (self.name, self.description)
-
-    def __str__(self):
-        return "HistSummary(%s, %s)" % (self.name, self.description)
-
-    def __lt__(self, other):
-        return self.name < other.name
-
-    def __hash__(self):
-        return hash(self.name)
+    # Delete the ratio plot now, before the cloned hists it uses,
+    # and leave the canvas empty for reuse
+    rp = None
+    c.Clear()
 
 
 def isclose(a, b, rel_tol=1e-06, abs_tol=0.0):
@@ -488,6 +524,71 @@ def analyse_hists(hist1, hist2):
     return HistSummary("SAME", "Histograms are the same (lowest priority)")
 
 
+def analyse_summaries(summary1, summary2):
+    """Analyse the summary statistics of one method from 2 dumps and return status.
+
+    Same classifications as analyse_hists(), but uses the statistics
+    stored by dumpNtuple.py --summary, so the dumped data isn't needed.
+
+    Parameters
+    ----------
+    summary1 : dict, optional
+    summary2 : dict, optional
+        Statistics for method, as made by columnStats.ColumnStats.to_dict()
+
+    Returns
+    -------
+    HistSummary
+        Summary info in the form of a HistSummary object
+    """
+    if summary2 is None and summary1 is None:
+        return HistSummary("BOTH_EMPTY", "Both hists not available")
+
+    if summary2 is None or summary1 is None:
+        return HistSummary("ONE_EMPTY", "One hist not available")
+
+    n_entries1 = summary1['count']
+    n_entries2 = summary2['count']
+
+    if n_entries1 == 0 and n_entries2 == 0:
+        return HistSummary("NO_ENTRIES", "Both hists has 0 entries")
+
+    if n_entries2 != n_entries1:
+        return HistSummary("DIFF_ENTRIES", "Differing number of entries")
+
+    if summary1['hash'] == summary2['hash']:
+        return HistSummary("IDENTICAL", "Values are identical (not plotted)")
+
+    if summary1['is_string'] or summary2['is_string']:
+        # equal hashes are IDENTICAL above
+        return HistSummary("DIFF_CONTENT", "Differing string values")
+
+    mean1, mean2 = summary1['mean'], summary2['mean']
+    rms1, rms2 = summary1['rms'], summary2['rms']
+    if not isclose(mean1, mean2) or not isclose(rms1, rms2):
+        return HistSummary("DIFF_MEAN_RMS", "Differing means and/or RMS")
+
+    range_lim = 1.0E10
+    # min/max are None if there are no finite values
+    mins = [x for x in [summary1['min'], summary2['min']] if x is not None]
+    maxs = [x for x in [summary1['max'], summary2['max']] if x is not None]
+    if mins and maxs:
+        xmin, xmax = min(mins), max(maxs)
+        if xmax - xmin > range_lim:
+            return HistSummary("VERY_LARGE_RANGE", "Values have very large range (> %g)" % range_lim)
+
+        if xmax > range_lim or xmin < -range_lim:
+            return HistSummary("EXTREME_VALUES", "x axis has very large values (+- %g)" % range_lim)
+
+    if (isclose(mean1, 0) and isclose(rms1, 0)) or (isclose(mean2, 0) and isclose(rms2, 0)):
+        return HistSummary("ZERO_VALUE", "One or both hists have only 0s")
+
+    if isclose(rms1, 0) or isclose(rms2, 0):
+        return HistSummary("ZERO_RMS", "One or both RMSs are 0: stores same value")
+
+    return HistSummary("SAME", "Histograms are the same (lowest priority)")
+
+
 def save_to_json(json_data, hist_status, output_filename):
     """Save plot info to JSON
 
@@ -523,6 +624,11 @@ def save_to_json(json_data, hist_status, output_filename):
 
     json_data['comparison'] = status_dict
 
+    # Store numbers from compare_distributions(), so methods can be ranked by severity
+    json_data['metrics'] = {hist_name: status.metrics
+                            for hist_name, status in hist_status.items()
+                            if status.metrics is not None and hist_name not in added_removed_hists}
+
     def _convert_entry(my_dict, key):
         """Replace basic list with dict of list and length"""
         col = my_dict[key]
@@ -539,6 +645,211 @@ def save_to_json(json_data, hist_status, output_filename):
         json.dump(json_data, jf, indent=2, sort_keys=True)
 
 
+def get_summary_hashes(dump_filename):
+    """Get content hash of each non-empty method from the summary file saved
+    alongside a dump by dumpNtuple.py --summary, if it exists
+
+    Parameters
+    ----------
+    dump_filename : str
+
+    Returns
+    -------
+    dict[str, str]
+        Hash for each method, empty if no summary file
+    """
+    summary_filename = get_summary_filename(dump_filename)
+    if not os.path.isfile(summary_filename):
+        return {}
+    try:
+        columns = load_summary(summary_filename)['columns']
+    except IOError as e:
+        print("Not using summary file:", e)
+        return {}
+    return {k: v['hash'] for k, v in columns.items() if v['count'] > 0}
+
+
+# Options for which plots to make for hists classified as SAME
+SAME_PLOTS_OPTIONS = ["all", "thumbnails", "none"]
+
+
+def get_plot_filenames(method_str, output_dir, fmts):
+    """Get filenames of all plots that may be made for a method by plot_hists_ROOT()
+
+    Returns
+    -------
+    dict[str, str]
+        Filename for each format, and for "thumbnail"
+    """
+    plot_name = method_str.replace("()", "")
+    filenames = {fmt: os.path.join(output_dir, "%s.%s" % (plot_name, fmt)) for fmt in fmts}
+    filenames['thumbnail'] = os.path.join(output_dir, "thumbnails", "%s.gif" % plot_name)
+    return filenames
+
+
+# Stores result of get_comparison_version(), as it is needed for every method
+_comparison_version = {}
+
+
+def get_comparison_version():
+    """Get hash of the code that makes & classifies the hists and plots,
+    so that cached comparisons are redone whenever it (or the ROOT version) changes
+
+    Returns
+    -------
+    str
+    """
+    if 'version' not in _comparison_version:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        hasher = hashlib.sha1(ROOT.gROOT.GetVersion().encode())
+        for filename in ["compareTreeDumps.py", "columnStats.py", "distributionMetrics.py",
+                         "rootMemory.py", "dumpReaders.py"]:
+            with open(os.path.join(script_dir, filename), 'rb') as f:
+                hasher.update(f.read())
+        _comparison_version['version'] = hasher.hexdigest()
+    return _comparison_version['version']
+
+
+def get_comparison_cache_key(method_str, hash1, hash2, fmts, make_thumbnail, same_plots):
+    """Make key for the comparison result cache, from everything that determines
+    the status and plots for a method
+
+    Returns
+    -------
+    str
+    """
+    key_info = dict(method=method_str, hash1=hash1, hash2=hash2, fmts=sorted(fmts),
+                    make_thumbnail=make_thumbnail, same_plots=same_plots,
+                    version=get_comparison_version())
+    return hashlib.sha1(json.dumps(key_info, sort_keys=True).encode()).hexdigest()
+
+
+def compare_hist(method_str, dump1, dump2, output_dir, fmts, make_thumbnail=False, same_plots="all",
+                 result_cache=None):
+    """Make, plot, and analyse the histograms for one method
+
+    Parameters
+    ----------
+    method_str : str
+    dump1, dump2 : dumpReaders.ColumnReader
+        Dumps from open_dump(). Methods not in a dump are treated as empty.
+        Each method's data are released once read, so only one is kept in memory.
+    output_dir : str
+        Output directory for plots
+    fmts : list[str]
+        Plot file formats
+    make_thumbnail : bool, optional
+        If True, also save thumbnail plots
+    same_plots : str, optional
+        Which plots to make if the hists are the same, one of SAME_PLOTS_OPTIONS:
+        "all" as for any other hists, "thumbnails" for only the thumbnail,
+        or "none" for no plots. For "none", the method is classified first
+        using summary statistics (see analyse_summaries()), so the histograms
+        aren't even made if the values are the same.
+    result_cache : RefCache, optional
+        If set, reuse the status & plots from a previous comparison of the same values,
+        and store them there otherwise
+
+    Returns
+    -------
+    HistSummary
+    """
+    def _get_data(dump):
+        data = dump.get_column(method_str) if method_str in dump else []
+        # The dump doesn't need to keep the data, we only use them here
+        dump.release(method_str)
+        return data
+
+    data1, data2 = _get_data(dump1), _get_data(dump2)
+
+    hash1, hash2 = None, None
+    if same_plots == "none":
+        # Cheap classification first, so we can skip the ROOT part entirely
+        # (this also finds IDENTICAL values)
+        column_stats1, column_stats2 = ColumnStats(), ColumnStats()
+        column_stats1.update(data1)
+        column_stats2.update(data2)
+        status = analyse_summaries(column_stats1.to_dict(), column_stats2.to_dict())
+        if status.name == "IDENTICAL":
+            return status
+        hash1, hash2 = column_stats1.content_hash, column_stats2.content_hash
+    elif len(data1) > 0 and len(data1) == len(data2):
+        hash1, hash2 = get_content_hash(data1), get_content_hash(data2)
+        if hash1 == hash2:
+            # No need to make hists if the values are exactly the same
+            return HistSummary("IDENTICAL", "Values are identical (not plotted)")
+
+    if result_cache is not None:
+        if hash1 is None:
+            hash1, hash2 = get_content_hash(data1), get_content_hash(data2)
+        cache_key = get_comparison_cache_key(method_str, hash1, hash2, fmts, make_thumbnail, same_plots)
+        plot_filenames = get_plot_filenames(method_str, output_dir, fmts)
+        cache_info = result_cache.restore(cache_key, plot_filenames, allow_missing=True)
+        if cache_info is not None:
+            # includes the metrics
+            return HistSummary(**cache_info['data']['status'])
+
+    def _store_result(status):
+        if result_cache is not None:
+            result_cache.store(cache_key, plot_filenames, key_info={'method': method_str},
+                               data={'status': {'name': status.name, 'description': status.description,
+                                                'metrics': status.metrics}})
+
+    # Compare the full distributions, to catch differences that the mean & RMS miss
+    metrics = compare_distributions(data1, data2)
+    if same_plots == "none":
+        status = analyse_metrics(status, metrics)
+        if status.name == "SAME":
+            # No plots, but store the status so the metrics needn't be recomputed
+            _store_result(status)
+            return status
+
+    hist1, stats1, hist2, stats2 = make_hists_ROOT(data1, data2, method_str)
+
+    # Do comparison
+    status = analyse_metrics(analyse_hists(hist1, hist2), metrics)
+
+    # Plot to file
+    if hist1 or hist2:
+        if same_plots == "thumbnails" and status.name == "SAME":
+            plot_hists_ROOT(hist1, stats1, hist2, stats2,
+                            output_dir,
+                            canvas_size=(800, 600),
+                            thumbnail_only=True)
+        else:
+            for fmt in fmts:
+                plot_hists_ROOT(hist1, stats1, hist2, stats2,
+                                output_dir,
+                                canvas_size=(800, 600),
+                                fmt=fmt,
+                                prepend="", append="",
+                                make_thumbnail=make_thumbnail)
+
+    _store_result(status)
+
+    return status
+
+
+# Each worker process opens the dumps itself, setup by _init_compare_worker
+_worker_state = {}
+
+
+def _init_compare_worker(filename1, filename2, output_dir, fmts, make_thumbnail, same_plots,
+                         result_cache_dir=None):
+    _worker_state['dump1'] = open_dump(filename1)
+    _worker_state['dump2'] = open_dump(filename2)
+    # The size limit is enforced once at the end by the main process
+    result_cache = RefCache(result_cache_dir) if result_cache_dir else None
+    _worker_state['plot_args'] = (output_dir, fmts, make_thumbnail, same_plots, result_cache)
+
+
+def _compare_hist_worker(method_str):
+    """Returns the HistSummary for this method, and the pid & RSS of the worker"""
+    status = compare_hist(method_str, _worker_state['dump1'], _worker_state['dump2'],
+                          *_worker_state['plot_args'])
+    return status, os.getpid(), get_rss()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("filename",
@@ -566,65 +877,75 @@ if __name__ == "__main__":
     parser.add_argument("--thumbnails",
                         help="Make thumbnail plots in <outputDir>/thumbnails",
                         action='store_true')
+    parser.add_argument("--samePlots",
+                        help="Which plots to make for hists that are the same: "
+                             "all plots (default), only thumbnails (requires --thumbnails), "
+                             "or none. For none, the values are compared using summary statistics first, "
+                             "and only differing hists are plotted.",
+                        choices=SAME_PLOTS_OPTIONS,
+                        default="all")
+    parser.add_argument("--resultCacheDir",
+                        help="Directory to cache comparison statuses & plots, reused for later comparisons "
+                             "of the same values of the same method",
+                        default=None)
+    default_result_cache_max_size = 5
+    parser.add_argument("--resultCacheMaxSize",
+                        help="Maximum size of --resultCacheDir in GB, least-recently-used entries are "
+                             "removed above this. Defaults to %g" % default_result_cache_max_size,
+                        type=float,
+                        default=default_result_cache_max_size)
+    parser.add_argument("--summaryOnly",
+                        help="Only compare the summary statistics saved by dumpNtuple.py --summary, "
+                             "without loading the dumps. No plots are made.",
+                        action='store_true')
+    parser.add_argument("--schemaOnly",
+                        help="Only compare which collections & methods exist, using tree schema JSONs "
+                             "made by dumpNtuple.py --schemaOnly (or ROOT ntuples, if made with the "
+                             "currently loaded libraries) as inputs. No entries are read and no plots are made.",
+                        action='store_true')
+    parser.add_argument("--jobs", "-j",
+                        help="Number of processes to use for making plots. "
+                             "The output JSON is the same for any number",
+                        type=int,
+                        default=1)
     parser.add_argument("--verbose", "-v",
                         help="Printout extra info",
                         action='store_true')
     args = parser.parse_args()
 
-    tree_data1 = {}
-    tree_data2 = {}
-
-    # whether to handle as HDF5 or awkward arrays
-    is_hdf5_1 = "hdf5" in os.path.splitext(args.filename)[1]
-    if not is_hdf5_1 and "awkd" not in os.path.splitext(args.filename)[1]:
-        raise IOError("Input must be .hdf5 or .awkd")
-
-    if is_hdf5_1:
-        import h5py
-        tree_data1 = h5py.File(args.filename)
-        print(len(tree_data1.keys()), "hists in main file")
+    if args.summaryOnly and args.schemaOnly:
+        raise RuntimeError("Cannot use both --summaryOnly and --schemaOnly")
+
+    if args.samePlots == "thumbnails" and not args.thumbnails:
+        raise RuntimeError("--samePlots thumbnails requires --thumbnails")
+
+    dump1 = dump2 = open_dump(None)
+    tree1_keys, tree2_keys = [], []
+    summaries1 = {}
+    summaries2 = {}
+
+    if args.summaryOnly:
+        summaries1 = load_summary(get_summary_filename(args.filename))['columns']
+        tree1_keys = list(summaries1.keys())
+        print(len(summaries1), "hists in main file summary")
+        if args.compareTo:
+            summaries2 = load_summary(get_summary_filename(args.compareTo))['columns']
+            tree2_keys = list(summaries2.keys())
+            print(len(summaries2), "hists in compareTo file summary")
+    elif args.schemaOnly:
+        tree1_keys = load_schema_methods(args.filename)
+        print(len(tree1_keys), "hists in main file schema")
+        if args.compareTo:
+            tree2_keys = load_schema_methods(args.compareTo)
+            print(len(tree2_keys), "hists in compareTo file schema")
     else:
-        import awkward
-        major, minor, _ =  awkward.version.version_info
-        major = int(major)
-        minor = int(minor)
-        if major == 1:
-            raise ImportError("Need awkward 0.12.X, you have %s" % awkward.__version__)
-        elif minor > 14:
-            raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-        elif minor < 12:
-            raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-
-        tree_data1 = awkward.load(args.filename)
-        print(len(tree_data1.columns), "hists in main file")
-
-    is_hdf5_2 = False
-    if args.compareTo:
-        is_hdf5_2 = "hdf5" in os.path.splitext(args.compareTo)[1]
-        if not is_hdf5_2 and "awkd" not in os.path.splitext(args.compareTo)[1]:
-            raise IOError("--compareTo input must be .hdf5 or .awkd")
-
-        if is_hdf5_2:
-            if not is_hdf5_1:
-                import h5py
-            tree_data2 = h5py.File(args.compareTo)
-            print(len(tree_data2.keys()), "hists in compareTo file")
-        else:
-            if is_hdf5_1:
-                import awkward
-                major, minor, _ =  awkward.version.version_info
-                major = int(major)
-                minor = int(minor)
-                if major == 1:
-                    raise ImportError("Need awkward 0.12.X, you have %s" % awkward.__version__)
-                elif minor > 14:
-                    raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-                elif minor < 12:
-                    raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-
-            tree_data2 = awkward.load(args.compareTo)
-            print(len(tree_data2.columns), "hists in compareTo file")
-
+        dump1 = open_dump(args.filename)
+        tree1_keys = dump1.columns
+        print(len(tree1_keys), "hists in main file")
+        dump2 = open_dump(args.compareTo)
+        tree2_keys = dump2.columns
+        if args.compareTo:
+            print(len(tree2_keys), "hists in compareTo file")
 
     json_data = {
         "added_collections": [],
@@ -633,12 +954,10 @@ if __name__ == "__main__":
         "removed_hists": []
     }
 
-    tree1_keys = tree_data1.keys() if is_hdf5_1 else tree_data1.columns
     collections1 = get_collections(tree1_keys)
 
-    tree2_keys, collections2 = [], []
+    collections2 = []
     if args.compareTo:
-        tree2_keys = tree_data2.keys() if is_hdf5_2 else tree_data2.columns
         collections2 = get_collections(tree2_keys)
         # Store added/removed collections
         # Added/removed are defined relative to the tree passed as --compareTo
@@ -657,6 +976,10 @@ if __name__ == "__main__":
         json_data['added_hists'].extend(added_hists)
         json_data['removed_hists'].extend(removed_hists)
         json_data['common_hists'] = sorted(list(hists1 & hists2))
+        if args.schemaOnly:
+            print("Added collections:", ", ".join(added) or "none")
+            print("Removed collections:", ", ".join(removed) or "none")
+            print(len(added_hists), "hists added,", len(removed_hists), "hists removed")
 
     # Setup output dirs
     if not os.path.isdir(args.outputDir):
@@ -680,44 +1003,93 @@ if __name__ == "__main__":
     # Use tqdm to get nice progress bar, and add hist name if verbose,
     # padded to keep constant position for progress bar
     # disable on non-TTY
-    pbar = tqdm(all_hists, disable=None)
-    max_len = max(len(l) for l in all_hists)
-    fmt_str = "{0: <%d}" % (max_len+2)
-    for method_str in pbar:
-        if args.verbose:
-            pbar.set_description(fmt_str.format(method_str))
-
-        # Make histograms
-        data1 = tree_data1[method_str] if method_str in tree1_keys else []
-        if not is_hdf5_1 and len(data1) > 0:
-            data1 = data1.flatten()
-
-        data2 = tree_data2[method_str] if method_str in tree2_keys else []
-        if not is_hdf5_2 and len(data2) > 0:
-            data2 = data2.flatten()
-
-        hist1, stats1, hist2, stats2 = make_hists_ROOT(data1, data2, method_str)
-
-        # Plot to file
-        if hist1 or hist2:
-            for fmt in args.fmt:
-                plot_hists_ROOT(hist1, stats1, hist2, stats2,
-                                args.outputDir,
-                                canvas_size=(800, 600),
-                                fmt=fmt,
-                                prepend="", append="",
-                                make_thumbnail=args.thumbnails)
+    # Methods with identical values can be found from the hashes in the summary files,
+    # if they exist, without loading the data. Others are hashed as they are loaded.
+    summary_identical = set()
+    if args.compareTo and not (args.summaryOnly or args.schemaOnly):
+        hashes1 = get_summary_hashes(args.filename)
+        hashes2 = get_summary_hashes(args.compareTo)
+        summary_identical = set(k for k in common_hists
+                                if k in hashes1 and hashes1[k] == hashes2.get(k))
+        if summary_identical:
+            print(len(summary_identical), "hists identical from summary files")
+    identical_status = HistSummary("IDENTICAL", "Values are identical (not plotted)")
+
+    result_cache = None
+    if args.resultCacheDir and not (args.summaryOnly or args.schemaOnly):
+        # The size limit is enforced once at the end, not after each store
+        result_cache = RefCache(args.resultCacheDir)
+
+    n_jobs = min(args.jobs, len(all_hists) - len(summary_identical))
+    if n_jobs > 1 and not (args.summaryOnly or args.schemaOnly):
+        from dumpNtuple import get_mp_context
+        print("Plotting with", n_jobs, "processes")
+        # Each worker opens the dumps itself, so don't keep them in memory here too
+        dump1.close()
+        dump2.close()
+        dump1 = dump2 = open_dump(None)
+        pool = get_mp_context().Pool(processes=n_jobs,
+                                     initializer=_init_compare_worker,
+                                     initargs=(args.filename, args.compareTo, args.outputDir,
+                                               args.fmt, args.thumbnails, args.samePlots,
+                                               args.resultCacheDir if result_cache is not None else None))
+        try:
+            # imap returns results in the order of all_hists, so hist_status is the same as for 1 process
+            to_compare = [m for m in all_hists if m not in summary_identical]
+            results = iter(tqdm(pool.imap(_compare_hist_worker, to_compare, chunksize=4),
+                                total=len(to_compare), disable=None))
+            worker_rss = {}
+            for ind, method_str in enumerate(all_hists):
+                if method_str in summary_identical:
+                    hist_status[method_str] = identical_status
+                else:
+                    hist_status[method_str], pid, rss = next(results)
+                    worker_rss[pid] = rss
+                if args.verbose and ind % RSS_TRACE_INTERVAL == 0:
+                    tqdm.write("%d hists done, main process %s, all workers %s"
+                               % (ind, format_rss(), format_rss(sum(x or 0 for x in worker_rss.values()))))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        pbar = tqdm(all_hists, disable=None)
+        max_len = max(len(l) for l in all_hists)
+        fmt_str = "{0: <%d}" % (max_len+2)
+        for ind, method_str in enumerate(pbar):
+            if args.verbose:
+                pbar.set_description(fmt_str.format(method_str))
+                if ind % RSS_TRACE_INTERVAL == 0:
+                    tqdm.write("%d hists done, %s" % (ind, format_rss()))
+
+            if args.schemaOnly:
+                hist_status[method_str] = HistSummary("NOT_COMPARED", "Only the tree structure was compared, not the values")
+                continue
+
+            if args.summaryOnly:
+                # missing methods are treated as empty, as for the dumps
+                empty_summary = ColumnStats().to_dict()
+                hist_status[method_str] = analyse_summaries(summaries1.get(method_str, empty_summary),
+                                                            summaries2.get(method_str, empty_summary))
+                continue
+
+            if method_str in summary_identical:
+                hist_status[method_str] = identical_status
+                continue
 
-        # Do comparison
-        status = analyse_hists(hist1, hist2)
-        hist_status[method_str] = status
+            hist_status[method_str] = compare_hist(method_str, dump1, dump2, args.outputDir,
+                                                   args.fmt, args.thumbnails, args.samePlots,
+                                                   result_cache)
 
     print(len(hist_status), "plots produced")
+    if args.verbose:
+        print(format_rss())
+
+    if result_cache is not None:
+        result_cache.max_size = int(args.resultCacheMaxSize * 1.0E9)
+        result_cache.enforce_size_limit()
 
     # Save JSON data. Always needed for later steps in pipeline to work.
     save_to_json(json_data, hist_status, output_filename=args.json)
 
-    if is_hdf5_1:
-        tree_data1.close()
-    if is_hdf5_2:
-        tree_data2.close()
+    dump1.close()
+    dump2.close()
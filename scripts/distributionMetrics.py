@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+
+"""Statistical comparison of the values of one method from 2 tree dumps,
+and the HistSummary status that the comparison results are stored in.
+
+Only needs numpy, so can be used & tested without ROOT.
+"""
+
+
+from __future__ import print_function
+
+import numpy as np
+
+
+class HistSummary(object):
+
+    def __init__(self, name, description, metrics=None):
+        """Simple class to hold info about summary between 2 hists
+
+        Parameters
+        ----------
+        name : str
+            Classification of summary
+        description : str
+            Detailed description
+        metrics : dict, optional
+            Numbers quantifying the difference, from compare_distributions()
+        """
+        self.name = name.upper().replace(" ", "_")
+        self.description = description
+        self.metrics = metrics
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __repr__(self):
+        return "HistSummary(%s, %s)" % (self.name, self.description)
+
+    def __str__(self):
+        return "HistSummary(%s, %s)" % (self.name, self.description)
+
+    def __lt__(self, other):
+        return self.name < other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+# Quantiles compared by compare_distributions()
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+# Number of bins for the chi2, as for the plots in make_hists_ROOT()
+CHI2_NBINS = 50
+
+# Maximum relative difference between values that is just rounding, e.g. from float precision
+ROUNDING_REL_TOL = 1.0E-5
+
+# KS distance above which distributions differ, even if the means & RMS don't
+KS_DISTANCE_LIMIT = 1.0E-3
+
+
+def _finite_or_none(x):
+    """Convert to float, or None if not finite, since JSON has no inf/NaN"""
+    x = float(x)
+    return x if np.isfinite(x) else None
+
+
+def compare_distributions(values1, values2):
+    """Compare all values of one method from 2 dumps, beyond the mean & RMS.
+
+    Computes in one go:
+
+    - the KS distance, i.e. the maximum difference between the cumulative distributions
+    - the binned chi2 per degree of freedom, for unnormalised hists
+    - the differences between quantiles, in units of the reference RMS
+    - the fraction of values that are exactly equal, comparing value by value
+
+    The last also gives the maximum relative difference between the values,
+    to tell rounding differences from real ones, and whether the values are
+    the same once sorted, i.e. only their order differs. Value-by-value metrics are only
+    computed if both have the same number of values, and are None otherwise.
+    The distribution metrics use finite values only.
+
+    Parameters
+    ----------
+    values1, values2 : numpy.ndarray, list
+        All values for the method, flattened over events, from the new & reference dump
+
+    Returns
+    -------
+    dict
+        Metrics, or None if either is empty or not numerical.
+        'severity' combines them into one number for ranking methods,
+        from 0 (same, or only rounding differences) to 1.
+    """
+    values1 = np.asarray(values1)
+    values2 = np.asarray(values2)
+    if len(values1) == 0 or len(values2) == 0:
+        return None
+    if values1.dtype.kind not in 'biuf' or values2.dtype.kind not in 'biuf':
+        return None
+    values1 = values1.astype(np.float64)
+    values2 = values2.astype(np.float64)
+
+    metrics = {
+        'equal_fraction': None,
+        'max_rel_diff': None,
+        'sorted_equal': None,
+        'ks_distance': None,
+        'chi2_ndf': None,
+        'quantile_diffs': None,
+        'max_quantile_diff': None,
+    }
+
+    if len(values1) == len(values2):
+        both_nan = np.isnan(values1) & np.isnan(values2)
+        equal = (values1 == values2) | both_nan
+        metrics['equal_fraction'] = float(np.count_nonzero(equal)) / len(equal)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff1, diff2 = values1[~equal], values2[~equal]
+            rel_diffs = np.abs(diff1 - diff2) / np.maximum(np.abs(diff1), np.abs(diff2))
+        # Differences involving NaN or inf are never just rounding
+        rel_diffs[~np.isfinite(rel_diffs)] = np.inf
+        metrics['max_rel_diff'] = _finite_or_none(rel_diffs.max()) if len(rel_diffs) > 0 else 0.
+
+    # NaN are sorted to the end
+    sorted1, sorted2 = np.sort(values1), np.sort(values2)
+    if len(values1) == len(values2):
+        metrics['sorted_equal'] = bool(np.all((sorted1 == sorted2) | (np.isnan(sorted1) & np.isnan(sorted2))))
+
+    finite1 = sorted1[np.isfinite(sorted1)]
+    finite2 = sorted2[np.isfinite(sorted2)]
+    if len(finite1) > 0 and len(finite2) > 0:
+        # The cumulative distributions only change at the values themselves
+        all_values = np.concatenate([finite1, finite2])
+        cdf1 = np.searchsorted(finite1, all_values, side='right') / float(len(finite1))
+        cdf2 = np.searchsorted(finite2, all_values, side='right') / float(len(finite2))
+        metrics['ks_distance'] = float(np.abs(cdf1 - cdf2).max())
+
+        xmin = min(finite1[0], finite2[0])
+        xmax = max(finite1[-1], finite2[-1])
+        if xmax > xmin:
+            edges = np.linspace(xmin, xmax, CHI2_NBINS + 1)
+            counts1 = np.histogram(finite1, bins=edges)[0].astype(np.float64)
+            counts2 = np.histogram(finite2, bins=edges)[0].astype(np.float64)
+        else:
+            counts1 = np.array([len(finite1)], dtype=np.float64)
+            counts2 = np.array([len(finite2)], dtype=np.float64)
+        # Chi2 for 2 unnormalised hists, as in TH1::Chi2Test() with option "UU"
+        n1, n2 = counts1.sum(), counts2.sum()
+        filled = (counts1 + counts2) > 0
+        chi2 = (((np.sqrt(n2 / n1) * counts1[filled] - np.sqrt(n1 / n2) * counts2[filled])**2)
+                / (counts1[filled] + counts2[filled])).sum()
+        ndf = max(int(np.count_nonzero(filled)) - 1, 1)
+        metrics['chi2_ndf'] = float(chi2) / ndf
+
+        quantiles1 = np.percentile(finite1, [100 * q for q in QUANTILES])
+        quantiles2 = np.percentile(finite2, [100 * q for q in QUANTILES])
+        scale = finite2.std() or max(abs(xmin), abs(xmax)) or 1.
+        quantile_diffs = (quantiles1 - quantiles2) / scale
+        metrics['quantile_diffs'] = [float(x) for x in quantile_diffs]
+        metrics['max_quantile_diff'] = float(np.abs(quantile_diffs).max())
+
+    is_rounding = metrics['max_rel_diff'] is not None and metrics['max_rel_diff'] <= ROUNDING_REL_TOL
+    if is_rounding:
+        metrics['severity'] = 0.
+    elif metrics['ks_distance'] is None:
+        # no finite values in one or both
+        metrics['severity'] = 0. if metrics['equal_fraction'] == 1 else 1.
+    else:
+        severities = [metrics['ks_distance'], min(metrics['max_quantile_diff'], 1.)]
+        if metrics['equal_fraction'] is not None:
+            severities.append(1. - metrics['equal_fraction'])
+        metrics['severity'] = max(severities)
+    return metrics
+
+
+def analyse_metrics(status, metrics):
+    """Refine the status from analyse_hists() or analyse_summaries()
+    using the metrics from compare_distributions().
+
+    Differences that are only rounding are no longer DIFF_MEAN_RMS,
+    and differences that don't change the mean & RMS are no longer e.g. SAME.
+
+    Parameters
+    ----------
+    status : HistSummary
+    metrics : dict
+        From compare_distributions(), if None the status is returned as-is
+
+    Returns
+    -------
+    HistSummary
+        With the metrics attached
+    """
+    if metrics is None:
+        return status
+
+    is_rounding = metrics['max_rel_diff'] is not None and metrics['max_rel_diff'] <= ROUNDING_REL_TOL
+
+    if status.name == "DIFF_MEAN_RMS" and is_rounding:
+        return HistSummary("ROUNDING_ONLY",
+                           "Values only differ by rounding (relative difference <= %g)" % ROUNDING_REL_TOL,
+                           metrics)
+
+    # These are only checked after the means & RMS are found to be the same
+    if status.name in ["VERY_LARGE_RANGE", "EXTREME_VALUES", "ZERO_VALUE", "ZERO_RMS", "SAME"] and not is_rounding:
+        if metrics['ks_distance'] is not None and metrics['ks_distance'] > KS_DISTANCE_LIMIT:
+            return HistSummary("DIFF_SHAPE",
+                               "Same means and RMS, but differing distributions (KS distance > %g)" % KS_DISTANCE_LIMIT,
+                               metrics)
+        if metrics['equal_fraction'] is not None and metrics['equal_fraction'] < 1:
+            if metrics['sorted_equal']:
+                return HistSummary("DIFF_ORDER", "Same values, but in a different order", metrics)
+            return HistSummary("DIFF_VALUES",
+                               "Same means, RMS and similar distributions, but some values differ",
+                               metrics)
+
+    return HistSummary(status.name, status.description, metrics)
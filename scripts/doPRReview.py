@@ -15,6 +15,11 @@ if __name__ == "__main__":
     parser.add_argument("--plots", help="Ntuple plots comparison markdown table filename", default=None)
     parser.add_argument("--timing", help="Timing markdown table filename", default=None)
     parser.add_argument("--size", help="Size markdown table filename", default=None)
+    parser.add_argument("--schema", help="Tree structure comparison markdown table filename", default=None)
+    parser.add_argument("--commentOnly",
+                        help="Only post a comment, without setting the PR status, "
+                             "e.g. for an early report before the full review",
+                        action='store_true')
     args = parser.parse_args()
 
     comment_text = "Report for PR %s\n" % (str(os.environ.get('PRNUM', None)))
@@ -23,6 +28,15 @@ if __name__ == "__main__":
     comment_text += "Webpages with full plots, timing & size info: https://uhh2-integration-results.web.cern.ch/uhh2-integration-results/%s\n\n" % (web_ending)
     comment_text += "Test samples defined here: https://gitlab.cern.ch/raggleto/UHH2-integration/blob/%s/scripts/cmsrun_jobs.py\n\n" % (os.environ['LOCALBRANCH'])
 
+    if args.schema:
+        if not os.path.isfile(args.schema):
+            print("Cannot find tree structure comparison file %s, skipping" % args.schema)
+        else:
+            comment_text += "\n\n**Tree structure report** (collections & methods only, full comparison to follow)\n\n"
+            with open(args.schema) as f:
+                comment_text += f.read()
+            comment_text += "\n\n"
+
     if args.plots:
         if not os.path.isfile(args.plots):
             print("Cannot find plots comparison file %s, skipping" % args.plots)
@@ -49,6 +63,9 @@ if __name__ == "__main__":
 
     comment_text = comment_text.replace("\n", "\\n").replace('"', '\\"')
     # print(comment_text)
-    return_code = subprocess.call('source ${CI_PROJECT_DIR}/scripts/notify_github.sh "passed" "%s"' % (comment_text), shell=True)
+    if args.commentOnly:
+        return_code = subprocess.call('source ${CI_PROJECT_DIR}/scripts/post_comment.sh "%s"' % (comment_text), shell=True)
+    else:
+        return_code = subprocess.call('source ${CI_PROJECT_DIR}/scripts/notify_github.sh "passed" "%s"' % (comment_text), shell=True)
     sys.exit(return_code)
     # sys.exit(0)
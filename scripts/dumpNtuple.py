@@ -16,10 +16,21 @@ import sys
 import json
 import argparse
 import inspect
+import fnmatch
+import hashlib
+import multiprocessing
+from timeit import default_timer as timer
+from array import array
 from operator import methodcaller, attrgetter
-from collections import OrderedDict, defaultdict
-from tqdm import trange
+from itertools import islice
+from collections import OrderedDict, defaultdict, Counter, deque
+from tqdm import tqdm
+import numpy as np
 import ROOT
+from stlToNumpy import stl_to_numpy, vector_to_numpy, VECTOR_DTYPES
+from entrySelection import select_entries, get_entry_shards
+from columnStats import update_column_stats, save_summary, get_summary_filename
+from dumpReaders import check_awkward_version, OFFSETS_GROUP
 
 
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -57,6 +68,33 @@ BUILTIN_TYPES = []
 for k in TYPES[0].keys():
     BUILTIN_TYPES.extend([d[k] for d in TYPES if d[k] is not None])
 
+# ROOT typedefs not in TYPES, and their equivalent in TYPES
+TYPE_ALIASES = {
+    "Double32_t": "double",
+    "Float16_t": "float",
+}
+
+
+def get_type_info(typename):
+    """Get entry in TYPES for a ROOT or C++ type name
+
+    Parameters
+    ----------
+    typename : str
+        e.g. "F", "Float_t", "float"
+
+    Returns
+    -------
+    dict
+        Entry in TYPES, or None if not a builtin type
+    """
+    typename = TYPE_ALIASES.get(typename, typename)
+    for tinfo in TYPES:
+        if typename in [tinfo['root_short'], tinfo['root_full'], tinfo['cpp']]:
+            return tinfo
+    return None
+
+
 # Methods specific to TLorentzVector, ROOT::TMath::LorentzVector, since we don't
 # want every method
 LORENTZVECTOR_METHODS = ["E", "Pt", "Pz", "X", "Y", "Z"]
@@ -237,10 +275,22 @@ def get_function_info(classname, method):
     return return_type, method_name, args
 
 
+# Results of get_class_getters_info() for each class, so that each class is only
+# introspected once per process, however many times (and trees) it appears in
+_class_info_cache = {}
+
+# Count classes introspected, and times their cached info was reused
+CLASS_INFO_COUNTER = Counter()
+
+
 def get_class_getters_info(classname, class_infos, do_recursive=False):
     """For a given class, get all getter methods & their return types,
     and all the class' properties. Updates/adds class_infos entry for that classname.
 
+    Each class is only introspected once per process, after which its cached
+    info is used. Classes already in class_infos are not recursed into again,
+    which also protects against cyclic types.
+
     Parameters
     ----------
     classname : str
@@ -251,6 +301,41 @@ def get_class_getters_info(classname, class_infos, do_recursive=False):
         If True, build chained methods using getters from objects
         returned by this class' getters
     """
+    if classname in _class_info_cache:
+        CLASS_INFO_COUNTER['reused'] += 1
+    else:
+        _class_info_cache[classname] = introspect_class(classname)
+        CLASS_INFO_COUNTER['resolved'] += 1
+
+    # Add before recursing, so it acts as a marker that this class is done/in progress
+    class_infos[classname] = _class_info_cache[classname]
+
+    if not do_recursive:
+        return
+
+    for return_type in class_infos[classname]['methods'].values():
+        if ("." in return_type
+            or unvectorise_classname(return_type) not in BUILTIN_TYPES
+            and return_type != "void"):
+            # Need to check if this return class is in our dict
+            return_type = unvectorise_classname(return_type)
+            if return_type not in class_infos:
+                get_class_getters_info(return_type, class_infos, do_recursive)
+
+
+def introspect_class(classname):
+    """Get all getter methods & their return types, and all the properties of a class.
+
+    Parameters
+    ----------
+    classname : str
+        Name of class
+
+    Returns
+    -------
+    dict
+        {"methods": {method name: return type}, "properties": [property names]}
+    """
     getter_info = {}
     # print("Getting getters for", classname)
 
@@ -273,15 +358,6 @@ def get_class_getters_info(classname, class_infos, do_recursive=False):
         return_type = return_type.replace("::", ".")
         getter_info[method_name] = return_type
 
-        if (do_recursive and
-            ("." in return_type
-             or unvectorise_classname(return_type) not in BUILTIN_TYPES
-             and return_type != "void")):
-            # Need to check if this return class is in our dict
-            return_type = unvectorise_classname(return_type)
-            # if return_type not in class_infos:
-            get_class_getters_info(return_type, class_infos, do_recursive)
-
     # Get properties e.g. enums
     # FIXME is it possible to get return type? normally int or float, but how to check?
     # __doc__ doesn't work, neither dir(), nor inspect
@@ -291,8 +367,7 @@ def get_class_getters_info(classname, class_infos, do_recursive=False):
                             or m in ["Class"])    # ROOT added methods we don't want
                  ]
 
-    class_infos[classname] = {"methods": getter_info, "properties": properties}
-    # print(class_infos[classname])
+    return {"methods": getter_info, "properties": properties}
 
 
 def unvectorise_classname(classname):
@@ -383,7 +458,8 @@ def get_class_properties(classname):
     return properties
 
 
-def add_list_of_methods(branch_name, branch_type, class_infos, method_list, do_properties=True):
+def add_list_of_methods(branch_name, branch_type, class_infos, method_list, do_properties=True,
+                        parent_types=()):
     """Add list of methods corresponding to class getters, does it recursively
 
     Parameters
@@ -398,6 +474,9 @@ def add_list_of_methods(branch_name, branch_type, class_infos, method_list, do_p
         List of nested getters corresponding to a histogram that will be updated
     do_properties : bool, optional
         If True, also add in class properties (filtered)
+    parent_types : tuple[str], optional
+        Classes of the objects earlier in the chain, used to avoid infinite
+        recursion with cyclic types
     """
     join_char = "."
     if branch_type in BUILTIN_TYPES:
@@ -410,13 +489,17 @@ def add_list_of_methods(branch_name, branch_type, class_infos, method_list, do_p
             if return_type in BUILTIN_TYPES or return_type not in class_infos:
                 # trivial type, can therefore add and stop there
                 method_list.append(join_char.join([branch_name, method_name]))
+            elif return_type in parent_types or return_type == branch_type:
+                # cyclic type, would recurse forever
+                continue
             else:
                 # return type is a class, so must go through all of its methods as well
                 add_list_of_methods(join_char.join([branch_name, method_name]),
                                     return_type,
                                     class_infos,
                                     method_list,
-                                    do_properties)
+                                    do_properties,
+                                    parent_types + (branch_type,))
 
         # add properties e.g. enums
         # only do this for properties of select classes eg source_candidate,
@@ -482,58 +565,447 @@ def safe_iter(thing):
         return iter([thing])
 
 
-def safe_next(thing):
-    """Call next() on `thing`: if iterable, then returns next in sequence as usual;
-    if single object returns object.
+class AccessorNode(object):
+
+    """Node in a prefix tree of chained accessors (methods or properties).
 
-    Also returns bool as to whether it was a single objext or iterable
+    Each node corresponds to one chained method string e.g. slimmedJets.subjets(),
+    and its children are the accessors to be called on the object(s) it returns.
+    This way each object is only accessed once per event, no matter how many
+    methods are called on it.
     """
-    try:
-        return next(thing), True
-    except TypeError:
-        return thing, False
 
+    def __init__(self, name, accessor=None):
+        self.name = name
+        self.accessor = accessor
+        self.children = OrderedDict()
+        self.is_leaf = False
 
-def iter_data(collection, methods):
-    # Using safe_iter here is required since our collection might be
-    # a single object (genInfo) or a vector (slimmedJets)
-    for obj in safe_iter(collection):
-        xs = [safe_iter(methods[0](obj))]
-        while xs:
-            try:
-                x, iterable = safe_next(xs[-1])
-                if len(xs) < (len(methods)):
-                    # Build up the stack of objects: we call the relevant
-                    # method on the previous layer's object (x)
-                    xs.append(safe_iter(methods[len(xs)](x)))
+    def __repr__(self):
+        return "AccessorNode(%s, leaf=%s, children=%d)" % (self.name, self.is_leaf, len(self.children))
+
+
+def build_method_trie(method_list):
+    """Build prefix trees of accessors from chained methods on collections.
+
+    e.g. [slimmedJets.pt(), slimmedJets.subjets().pt(), slimmedJets.subjets().eta()]
+    gives slimmedJets -> {pt(), subjets() -> {pt(), eta()}}
+
+    Methods without a collection (i.e. without a ".") are ignored.
+
+    Parameters
+    ----------
+    method_list : list[str]
+        List of chained methods
+
+    Returns
+    -------
+    OrderedDict[str, AccessorNode]
+        Root node for each collection
+    """
+    method_trie = OrderedDict()
+    for method in method_list:
+        mparts = method.split(".")
+        if len(mparts) < 2:
+            continue
+        node = method_trie.setdefault(mparts[0], AccessorNode(mparts[0]))
+        for ind, mp in enumerate(mparts[1:], 1):
+            if mp not in node.children:
+                if mp.endswith("()"):
+                    accessor = methodcaller(mp.replace("()", ""))
                 else:
-                    # Here we have all the necessary layers,
-                    # so we just return the value
-                    yield x
-                # handle case of singel value, needs StopIteration to exit
-                if not iterable:
-                    raise StopIteration
-            except StopIteration:
-                xs.pop()
-
-
-# This is needed to process a ROOT.vector<bool>, since they are treated differently,
-# and badly (really a vector of ROOT._bit_reference, which are impossible to deal with)
-# Instead we load this function, to neatly convert the vector into a vector of ints
-# Taken from https://gist.github.com/rmanzoni/5b65bdcd5a89bfd871a1be13145d9306
-PROCESS_VECTOR_OF_BOOL_CPP = """
-std::vector<int> vectorBoolToInt(const std::vector<bool> vec) {
-  std::vector<int> results;
-  for (uint i=0; i<vec.size(); i++) {
-    results.push_back(vec[i] == true);
-  }
-  return results;
+                    accessor = attrgetter(mp)
+                node.children[mp] = AccessorNode(".".join(mparts[:ind+1]), accessor)
+            node = node.children[mp]
+        node.is_leaf = True
+    return method_trie
+
+
+def walk_accessor_node(node, obj, this_data):
+    """Call all child accessors of `node` on `obj`, recursing into the returned objects,
+    and store the values for any leaf accessors in this_data.
+
+    Parameters
+    ----------
+    node : AccessorNode
+        Node whose children are to be called on obj
+    obj : object
+        Object to call the accessors on
+    this_data : dict[str, list]
+        Values for each method, appended to in-place.
+        Vectors of numbers are appended as one numpy array each, see join_array_values()
+    """
+    for child in node.children.values():
+        result = child.accessor(obj)
+        if child.is_leaf and not child.children:
+            # vectors of numbers are converted in one go, not element by element.
+            # Copy, since the vector may be a temporary that is deleted once we return
+            arr = stl_to_numpy(result)
+            if arr is not None:
+                this_data[child.name].append(arr.copy())
+                continue
+        # Using safe_iter here is required since our accessor might return
+        # a single object or a vector
+        for x in safe_iter(result):
+            if child.is_leaf:
+                this_data[child.name].append(x)
+            if child.children:
+                walk_accessor_node(child, x, this_data)
+
+
+def join_array_values(values):
+    """Join the values for one method from walk_accessor_node() into one array,
+    if they are numpy arrays (i.e. the method returns a vector of numbers)
+
+    Parameters
+    ----------
+    values : list
+
+    Returns
+    -------
+    list, numpy.ndarray
+    """
+    if values and isinstance(values[0], np.ndarray):
+        return np.concatenate(values)
+    return values
+
+
+# Helpers for the JIT-compiled method chains.
+# each() mimics safe_iter(): it calls f on every element if x is a std::vector,
+# otherwise just calls f on x itself
+METHOD_CHAIN_HELPERS_CPP = """
+namespace uhh2dump {
+template <typename T, typename F>
+void each(const T & x, F f) { f(x); }
+
+template <typename T, typename A, typename F>
+void each(const std::vector<T, A> & vec, F f) { for (const auto & x : vec) f(x); }
 }
 """
-ROOT.gInterpreter.ProcessLine(PROCESS_VECTOR_OF_BOOL_CPP)
 
+# Counter to ensure compiled function names are unique within a process,
+# since cling does not allow redefinitions
+_compiled_chain_counter = 0
+
+# Whether METHOD_CHAIN_HELPERS_CPP has been declared successfully in this process
+_helpers_declared = False
+
+
+def get_chain_buffer_type(typename):
+    """Get the C++ type of the buffer used to store values of type `typename`
+    returned by a compiled method chain.
+
+    All floating-point values are stored as double, and all integers as 64-bit,
+    so that the values are exactly those that PyROOT would return.
+
+    Parameters
+    ----------
+    typename : str
+        ROOT or C++ typename of the values returned by the method chain
+
+    Returns
+    -------
+    str
+        C++ type of buffer elements, or None if unsupported (e.g. strings, chars)
+    """
+    tinfo = get_type_info(typename)
+    if tinfo is None or tinfo['cpp'] in ['string', 'char', 'unsigned char']:
+        # PyROOT returns str for these, keep them in python
+        return None
+    if tinfo['py_short'] in ['f', 'd']:
+        return "double"
+    if tinfo['py_short'] in ['H', 'I', 'L']:
+        return "ULong64_t"
+    return "Long64_t"  # signed ints & bool
+
+
+class CompiledChain(object):
+
+    """Wrapper around a JIT-compiled C++ function that evaluates one method chain
+    on a collection, filling a contiguous buffer"""
+
+    def __init__(self, func, buffer_type, is_bool=False):
+        self.func = func
+        self.buffer = ROOT.std.vector(buffer_type)()
+        self.dtype = VECTOR_DTYPES[buffer_type]
+        self.is_bool = is_bool
+
+    def __call__(self, collection):
+        """Returns numpy array viewing the buffer, only valid until the next call"""
+        self.buffer.clear()
+        self.func(collection, self.buffer)
+        values = vector_to_numpy(self.buffer, self.dtype)
+        if self.is_bool:
+            return values.astype(np.bool_)
+        return values
+
+
+def make_chain_cpp(func_name, method, collection_type, buffer_type):
+    """Make C++ source for a function that evaluates a chained method on a collection
+
+    e.g. slimmedJets.subjets().pt() ->
+
+        void chain_0(const vector<Jet> & coll, std::vector<double> & out) {
+          each(coll, [&](const auto & o0) {
+            each(o0.subjets(), [&](const auto & o1) {
+              each(o1.pt(), [&](const auto & o2) {
+                out.push_back(o2);
+        ...
+
+    Parameters
+    ----------
+    func_name : str
+        Name of C++ function
+    method : str
+        Chained method string that starts with collection name
+    collection_type : str
+        C++ class of collection e.g. vector<Jet>
+    buffer_type : str
+        C++ type of output buffer elements
 
-def get_data(tree, entry_index, method_strs):
+    Returns
+    -------
+    str
+    """
+    mparts = method.split(".")
+    lines = ["void %s(const %s & coll, std::vector<%s> & out) {" % (func_name, collection_type, buffer_type)]
+    current = "coll"
+    for ind, mp in enumerate(mparts[1:]):
+        lines.append("  " * (ind+1) + "each(%s, [&](const auto & o%d) {" % (current, ind))
+        current = "o%d.%s" % (ind, mp)
+    depth = len(mparts)
+    lines.append("  " * depth + "each(%s, [&](const auto & o%d) {" % (current, depth-1))
+    lines.append("  " * (depth+1) + "out.push_back(o%d);" % (depth-1))
+    for ind in range(depth, 0, -1):
+        lines.append("  " * ind + "});")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def compile_method_chains(method_list, tree_info, class_infos):
+    """JIT-compile C++ functions to evaluate chained methods natively,
+    avoiding the many PyROOT calls made when walking the accessors in python.
+
+    Only chains of getters (not properties) that end in a numeric type are
+    compiled. Chains that fail to compile are left for the python path.
+
+    Parameters
+    ----------
+    method_list : list[str]
+        List of chained methods
+    tree_info : list[BranchInfo]
+        List with info about branch collections in tree
+    class_infos : dict
+        Dict with info about methods for classes
+
+    Returns
+    -------
+    dict[str, CompiledChain]
+        Compiled chain for each method that could be compiled
+    """
+    global _compiled_chain_counter, _helpers_declared
+
+    if not _helpers_declared:
+        if not ROOT.gInterpreter.Declare(METHOD_CHAIN_HELPERS_CPP):
+            # every chain uses the helpers, so none could compile
+            print("Cannot compile method chain helpers, using python instead")
+            return {}
+        _helpers_declared = True
+
+    # group by collection, so we only call the interpreter once per collection
+    candidates = OrderedDict()
+    for method in method_list:
+        mparts = method.split(".")
+        if len(mparts) < 2 or not all(mp.endswith("()") for mp in mparts[1:]):
+            continue
+        return_types = get_compounded_return_types(method, tree_info, class_infos)
+        if not return_types:
+            continue
+        buffer_type = get_chain_buffer_type(return_types[-1])
+        if buffer_type is None:
+            continue
+        func_name = "chain_%d" % _compiled_chain_counter
+        _compiled_chain_counter += 1
+        is_bool = return_types[-1] in ['bool', 'Bool_t', 'O']
+        src = make_chain_cpp(func_name, method, return_types[0], buffer_type)
+        candidates.setdefault(mparts[0], []).append((method, func_name, buffer_type, is_bool, src))
+
+    compiled_chains = {}
+    for collection_name, chains in candidates.items():
+        wrap = "namespace uhh2dump {\n%s\n}"
+        if not ROOT.gInterpreter.Declare(wrap % "\n".join(c[-1] for c in chains)):
+            # Try each individually, so one bad chain doesn't spoil the rest.
+            # Renamed since cling may have kept some of the definitions
+            good_chains = []
+            for method, func_name, buffer_type, is_bool, src in chains:
+                new_func_name = func_name + "_retry"
+                src = src.replace(func_name + "(", new_func_name + "(", 1)
+                if ROOT.gInterpreter.Declare(wrap % src):
+                    good_chains.append((method, new_func_name, buffer_type, is_bool, src))
+                else:
+                    print("Cannot compile", method, ", using python instead")
+            chains = good_chains
+        for method, func_name, buffer_type, is_bool, _ in chains:
+            compiled_chains[method] = CompiledChain(getattr(ROOT.uhh2dump, func_name),
+                                                    buffer_type, is_bool)
+    return compiled_chains
+
+
+class DumpProfile(object):
+
+    """Wall time, number of calls & number of values emitted for each method chain
+    and each collection, to find the expensive getters.
+
+    The time for a method chain is only that of its last accessor (plus conversion),
+    since accessors are shared between chains with a common prefix.
+    The time for a collection is that of reading its branch & evaluating all of its methods.
+    """
+
+    def __init__(self):
+        self.methods = {}
+        self.collections = {}
+
+    def add_method(self, method, time_taken):
+        entry = self.methods.setdefault(method, {'time': 0., 'calls': 0, 'values': 0})
+        entry['time'] += time_taken
+        entry['calls'] += 1
+
+    def _get_collection(self, collection):
+        return self.collections.setdefault(collection, {'read_time': 0., 'eval_time': 0., 'events': 0})
+
+    def add_read(self, collection, time_taken):
+        entry = self._get_collection(collection)
+        entry['read_time'] += time_taken
+        entry['events'] += 1
+
+    def add_eval(self, collection, time_taken):
+        self._get_collection(collection)['eval_time'] += time_taken
+
+    def add_values(self, tree_data):
+        """Add number of values emitted for each method
+
+        Parameters
+        ----------
+        tree_data : dict[str, ColumnAccumulator]
+        """
+        for method in tree_data:
+            entry = self.methods.setdefault(method, {'time': 0., 'calls': 0, 'values': 0})
+            entry['values'] += len(tree_data[method])
+
+    def clear(self):
+        self.methods.clear()
+        self.collections.clear()
+
+    def merge(self, other):
+        """Add all numbers from another DumpProfile"""
+        for this_dict, other_dict in [(self.methods, other.methods),
+                                      (self.collections, other.collections)]:
+            for name, other_entry in other_dict.items():
+                if name not in this_dict:
+                    this_dict[name] = dict(other_entry)
+                else:
+                    for key, value in other_entry.items():
+                        this_dict[name][key] += value
+
+    def to_dict(self):
+        """Get profile as dict, with methods & collections sorted by decreasing time
+
+        Returns
+        -------
+        dict
+        """
+        methods = []
+        for name, entry in self.methods.items():
+            this_entry = dict(entry, name=name, collection=name.split(".")[0])
+            this_entry['time_per_call'] = entry['time'] / entry['calls'] if entry['calls'] else 0.
+            methods.append(this_entry)
+        methods.sort(key=lambda x: x['time'], reverse=True)
+
+        values_per_collection = Counter()
+        for entry in methods:
+            values_per_collection[entry['collection']] += entry['values']
+        collections = []
+        for name, entry in self.collections.items():
+            this_entry = dict(entry, name=name, values=values_per_collection[name])
+            this_entry['time'] = entry['read_time'] + entry['eval_time']
+            collections.append(this_entry)
+        collections.sort(key=lambda x: x['time'], reverse=True)
+
+        return {
+            'total_time': sum(x['time'] for x in collections),
+            'collections': collections,
+            'methods': methods,
+        }
+
+    def save(self, output_filename):
+        with open(output_filename, 'w') as jf:
+            json.dump(self.to_dict(), jf, indent=2, sort_keys=True)
+
+
+class ProfiledAccessor(object):
+
+    """Wrapper around an accessor that records its time & number of calls in a DumpProfile"""
+
+    def __init__(self, name, accessor, profile):
+        self.name = name
+        self.accessor = accessor
+        self.profile = profile
+
+    def __call__(self, obj):
+        start = timer()
+        result = self.accessor(obj)
+        self.profile.add_method(self.name, timer() - start)
+        return result
+
+
+def profile_method_trie(method_trie, profile):
+    """Wrap all accessors in method_trie so they record their timing in `profile`
+
+    Parameters
+    ----------
+    method_trie : OrderedDict[str, AccessorNode]
+    profile : DumpProfile
+    """
+    def _wrap(node):
+        for child in node.children.values():
+            child.accessor = ProfiledAccessor(child.name, child.accessor, profile)
+            _wrap(child)
+
+    for root_node in method_trie.values():
+        _wrap(root_node)
+
+
+def get_branch_value(thing):
+    """Convert the object for a top-level branch into value(s) to be stored
+
+    Parameters
+    ----------
+    thing : object
+        Object from PyROOT for the branch
+
+    Returns
+    -------
+    list, numpy.ndarray, or scalar
+    """
+    arr = stl_to_numpy(thing)
+    if arr is not None:
+        # vector<bool> comes back as 0/1 ints
+        return arr
+    type_str = str(type(thing))
+    if "ROOT.string" in type_str:
+        return [str(thing)]  # don't want to iter over each character
+    elif "ROOT.vector<string>" in type_str:
+        return [str(d) for d in thing]
+    try:
+        # handle iterative branches
+        return [d for d in thing]
+    except TypeError:
+        # handle scalar branches
+        return thing
+
+
+def get_data(tree, entry_index, method_strs, compiled_chains=None, method_trie=None, branches=None,
+             profile=None):
     """Get data from chained method in `method_str` by iterating over the tree.
     This is designed for method chains that include methods that return vectors,
     since TTree.Draw can't handle them. However it is naturally slower.
@@ -547,6 +1019,17 @@ def get_data(tree, entry_index, method_strs):
     method_strs : [str]
         List of chained method string that starts with collection name
         e.g. slimmedJets.btaginfo().TrackEta()
+    compiled_chains : dict[str, CompiledChain], optional
+        JIT-compiled C++ method chains, used instead of iterating in python
+        for those methods in it
+    method_trie : OrderedDict[str, AccessorNode], optional
+        Prefix trees of accessors for the methods in `method_strs` that are
+        not in `compiled_chains`. If None, made from `method_strs`.
+    branches : list[ROOT.TBranch], optional
+        Branches to read for this entry. If None, reads all branches in the tree.
+    profile : DumpProfile, optional
+        If set, record the time spent reading each branch & evaluating each method.
+        Accessors in method_trie must already be wrapped, see profile_method_trie()
 
     Yields
     ------
@@ -554,64 +1037,230 @@ def get_data(tree, entry_index, method_strs):
         Data in the tree for this event. Each entry is a method, with its
         associated value(s), either a scalar or a list
     """
-    tree.GetEntry(entry_index)
+    if branches is None:
+        tree.GetEntry(entry_index)
+    else:
+        # Using br.GetEntry() and not tree.GetEntry() offers a BIG speedup,
+        # since it will otherwise read *every* collection
+        #
+        # WARNING: you cannot use:
+        # tree.SetBranchStatus("*", 0)
+        # tree.SetBranchStatus(collection_name, 1)
+        # since the latter doesn't correctly reinstate the branch, for unknown reason
+        tree.LoadTree(entry_index)  # so the TTreeCache knows where we are
+        for br in branches:
+            start = timer()
+            br.GetEntry(entry_index)
+            if profile is not None:
+                profile.add_read(br.GetName(), timer() - start)
 
     this_data = OrderedDict()
 
+    if method_trie is None:
+        method_trie = build_method_trie([m for m in method_strs
+                                         if not (compiled_chains and m in compiled_chains)])
+
     for method in method_strs:
 
         if "." in method:
-            mparts = method.split(".")
-            if len(mparts) < 2:
-                raise RuntimeError("Improper tree variable, should be xxx.yyy at least")
-
-            collection_name = mparts[0]
-
-            # To handle any number of chained method calls, we have to build a stack
-            # of methods, and of objects. The latter is updated each time the lower
-            # iteration finishes.
-            # Inspired by https://stackoverflow.com/a/45503317
-            methods = []
-            for mp in mparts[1:]:
-                if mp.endswith("()"):
-                    methods.append(methodcaller(mp.replace("()", "")))
-                else:
-                    methods.append(attrgetter(mp))
-
-            this_data[method] = [d for d in iter_data(getattr(tree, collection_name), methods)]
-        else:
-            thing = getattr(tree, method)
-            type_str = str(type(thing))
-            if "ROOT.vector<bool>" in type_str:
-                thing = ROOT.vectorBoolToInt(thing)
-            if "ROOT.string" in type_str:
-                this_data[method] = [str(thing)]  # don't want to iter over each character
-            elif "ROOT.vector<string>" in type_str:
-                this_data[method] = [str(d) for d in thing]
+            if compiled_chains and method in compiled_chains:
+                collection_name = method.split(".")[0]
+                start = timer()
+                this_data[method] = compiled_chains[method](getattr(tree, collection_name))
+                if profile is not None:
+                    time_taken = timer() - start
+                    profile.add_method(method, time_taken)
+                    profile.add_eval(collection_name, time_taken)
             else:
-                try:
-                    # handle iterative branches
-                    this_data[method] = [d for d in thing]
-                except TypeError:
-                    # handle scalar branches
-                    this_data[method] = thing
+                # filled when walking the accessor trie below,
+                # but create the entry now to keep the method order
+                this_data[method] = []
+        else:
+            start = timer()
+            this_data[method] = get_branch_value(getattr(tree, method))
+            if profile is not None:
+                time_taken = timer() - start
+                profile.add_method(method, time_taken)
+                profile.add_eval(method, time_taken)
+
+    # Walk each collection once, calling all the accessors on each object.
+    # Using safe_iter here is required since our collection might be
+    # a single object (genInfo) or a vector (slimmedJets)
+    for collection_name, root_node in method_trie.items():
+        start = timer()
+        for obj in safe_iter(getattr(tree, collection_name)):
+            walk_accessor_node(root_node, obj, this_data)
+        if profile is not None:
+            profile.add_eval(collection_name, timer() - start)
+
+    for method in this_data:
+        if "." in method and not (compiled_chains and method in compiled_chains):
+            this_data[method] = join_array_values(this_data[method])
 
     return this_data
 
 
+def filter_methods(method_list, include_collections=None, exclude_collections=None):
+    """Select methods by the name of their collection (or branch)
+
+    Parameters
+    ----------
+    method_list : list[str]
+        List of chained methods
+    include_collections : list[str], optional
+        Only keep collections matching any of these (wildcard) patterns.
+        If None or empty, keep all collections.
+    exclude_collections : list[str], optional
+        Remove collections matching any of these (wildcard) patterns.
+        Takes precedence over `include_collections`.
+
+    Returns
+    -------
+    list[str]
+        Selected methods, in the same order
+    """
+    def _matches(name, patterns):
+        return any(fnmatch.fnmatchcase(name, p) for p in patterns)
+
+    selected = []
+    for method in method_list:
+        collection_name = method.split(".")[0]
+        if include_collections and not _matches(collection_name, include_collections):
+            continue
+        if exclude_collections and _matches(collection_name, exclude_collections):
+            continue
+        selected.append(method)
+    return selected
+
+
+def get_branch_names(method_list):
+    """Get the (top-level) branches needed to evaluate methods, in order
+
+    Parameters
+    ----------
+    method_list : list[str]
+        List of chained methods
+
+    Returns
+    -------
+    list[str]
+    """
+    branch_names = []
+    for method in method_list:
+        name = method.split(".")[0]
+        if name not in branch_names:
+            branch_names.append(name)
+    return branch_names
+
+
+# Limits for the size of TTreeCache, in bytes
+MIN_CACHE_SIZE = 1 * 1024 * 1024
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def setup_tree_cache(tree, branches):
+    """Setup TTreeCache for only the branches we will read.
+
+    Size is set to hold one cluster of baskets for all of these branches,
+    with some headroom for baskets that straddle clusters.
+
+    Parameters
+    ----------
+    tree : ROOT.TTree
+    branches : list[ROOT.TBranch]
+
+    Returns
+    -------
+    int
+        Cache size in bytes
+    """
+    zip_bytes = sum(br.GetZipBytes("*") for br in branches)
+    n_entries = max(tree.GetEntries(), 1)
+    cluster_entries = tree.GetAutoFlush()  # if < 0, it is a number of bytes, not entries
+    if 0 < cluster_entries < n_entries:
+        zip_bytes = zip_bytes * float(cluster_entries) / n_entries
+    cache_size = int(min(max(1.5 * zip_bytes, MIN_CACHE_SIZE), MAX_CACHE_SIZE))
+    tree.SetCacheSize(cache_size)
+    for br in branches:
+        tree.AddBranchToCache(br, True)
+    tree.StopCacheLearningPhase()
+    return cache_size
+
+
 def check_tobj(tobj):
     """Check if TObject is valid, if not raise IOError"""
     if tobj == None or tobj.IsZombie():
         raise IOError("Cannot access %s" % tobj.GetName())
 
 
-def parse_tree(tree):
+def get_library_fingerprint():
+    """Get fingerprint of all loaded libraries & their dictionaries,
+    which determine the classes & methods available in PyROOT.
+
+    Includes the UHH2 libraries in $CMSSW_BASE if available,
+    in case they aren't loaded yet.
+
+    Returns
+    -------
+    list[(str, int, int)]
+        Filename, size & modification time of each file
+    """
+    filenames = ROOT.gSystem.GetLibraries("", "", False).split()
+    cmssw_lib_dir = os.path.join(os.environ.get("CMSSW_BASE", ""), "lib", os.environ.get("SCRAM_ARCH", ""))
+    if os.environ.get("CMSSW_BASE") and os.path.isdir(cmssw_lib_dir):
+        filenames.extend(os.path.join(cmssw_lib_dir, f)
+                         for f in sorted(os.listdir(cmssw_lib_dir)) if "UHH2" in f)
+    # dictionaries are stored alongside libraries in pcm files
+    filenames.extend([os.path.splitext(f)[0] + "_rdict.pcm" for f in filenames])
+
+    fingerprint = []
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            continue
+        stat = os.stat(filename)
+        fingerprint.append((filename, stat.st_size, int(stat.st_mtime)))
+    return sorted(set(fingerprint))
+
+
+def get_parse_cache_filename(cache_dir, tree_info):
+    """Get filename for cached parse_tree() results.
+
+    This is a hash of the loaded libraries, the branches in the tree,
+    and this script (since it determines the parsing).
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory
+    tree_info : list[BranchInfo]
+        List of collections in tree
+
+    Returns
+    -------
+    str
+    """
+    with open(os.path.abspath(__file__.replace(".pyc", ".py")), 'rb') as f:
+        script_hash = hashlib.sha1(f.read()).hexdigest()
+    key_info = {
+        "libraries": get_library_fingerprint(),
+        "branches": [(b.name, b.classname, b.typename) for b in tree_info],
+        "script": script_hash,
+    }
+    key = hashlib.sha1(json.dumps(key_info, sort_keys=True).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, "parse_tree_%s.json" % key)
+
+
+def parse_tree(tree, cache_dir=None):
     """Parse TTree by storing collections, types & their methods,
     and compiling list of chained methods corresponding to object getters.
 
     Parameters
     ----------
     tree : ROOT.TTree
+    cache_dir : str, optional
+        If set, load class info & chained methods from a cache file in this directory
+        if it was made with the same libraries & tree structure,
+        otherwise save them there for next time.
 
     Returns
     -------
@@ -624,6 +1273,15 @@ def parse_tree(tree):
     tree_info = []
     store_branches(tree, tree_info, do_recursive=False, indent=None)
 
+    cache_filename = None
+    if cache_dir:
+        cache_filename = get_parse_cache_filename(cache_dir, tree_info)
+        if os.path.isfile(cache_filename):
+            print("Loading class info from", cache_filename)
+            with open(cache_filename) as f:
+                cache_data = json.load(f, object_pairs_hook=OrderedDict)
+            return tree_info, cache_data['class_infos'], cache_data['method_list']
+
     # Since ROOT can't see beyond 2 levels of classes,
     # let's manually figure out class methods
     class_infos = OrderedDict()
@@ -636,6 +1294,16 @@ def parse_tree(tree):
         # add method strings to be processed
         add_list_of_methods(binfo.name, classname, class_infos, method_list, do_properties=True)
 
+    if cache_filename:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write to temp file & rename, so other processes never see a partial file
+        tmp_filename = "%s.%d.tmp" % (cache_filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump({"class_infos": class_infos, "method_list": method_list}, f)
+        os.rename(tmp_filename, cache_filename)
+        print("Saved class info to", cache_filename)
+
     return tree_info, class_infos, method_list
 
 
@@ -651,31 +1319,774 @@ def print_tree_summary(tree_info, class_info, label):
     print("-" * 80)
 
 
-def get_size(obj, seen=None):
-    """Recursively finds size of objects
+def get_peak_rss():
+    """Get peak resident set size (RSS) of this process, and the largest of its
+    finished child processes
+
+    Returns
+    -------
+    (int, int)
+        In bytes, or (None, None) if not available on this platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def open_tree(input_filename, tree_name):
+    """Open TFile and get TTree from it
+
+    Parameters
+    ----------
+    input_filename : str
+        Input Ntuple filename
+    tree_name : str
+        Name of TTree inside input file
+
+    Returns
+    -------
+    ROOT.TFile, ROOT.TTree
+        File must be kept alive as long as the tree is used
+    """
+    f_in = ROOT.TFile(input_filename)
+    if f_in.IsZombie():
+        raise RuntimeError("Cannot open ROOT file %s" % input_filename)
+    tree = f_in.Get(tree_name)
+    check_tobj(tree)
+    return f_in, tree
+
+
+# Typecode for string columns in ColumnAccumulator, not a real array typecode
+STRING_TYPECODE = "str"
+
+
+def get_column_typecode(method, tree_info, class_infos):
+    """Get array typecode to store values returned by a method, using TYPES
+
+    Parameters
+    ----------
+    method : str
+        Chained method e.g. slimmedJets.pt(), or branch name e.g. run
+    tree_info : list[BranchInfo]
+        List with info about branch collections in tree
+    class_infos : dict
+        Dict with info about methods for classes
+
+    Returns
+    -------
+    str, bool
+        array typecode, STRING_TYPECODE for strings,
+        or None if the type cannot be determined.
+        Also whether the values are bools.
+    """
+    mparts = method.split(".")
+    if len(mparts) == 1:
+        br_info = [x for x in tree_info if x.name == method]
+        if not br_info:
+            return None, False
+        classname = br_info[0].classname
+        typename = unvectorise_classname(classname)
+        if classname.startswith("vector<") and typename == "bool":
+            # converted to 0/1 ints by stl_to_numpy
+            return 'i', False
+    else:
+        if not all(mp.endswith("()") for mp in mparts[1:]):
+            # we don't know the type of properties
+            return None, False
+        return_types = get_compounded_return_types(method, tree_info, class_infos)
+        if not return_types:
+            return None, False
+        if "LorentzVector" in return_types[-2]:
+            # LorentzVector methods are assumed to return float, but actually return double
+            return 'd', False
+        typename = return_types[-1]
+
+    tinfo = get_type_info(typename)
+    if tinfo is None:
+        return None, False
+    if tinfo['cpp'] in ['string', 'char', 'unsigned char']:
+        # PyROOT returns str for these
+        return STRING_TYPECODE, False
+    return tinfo['py_short'], tinfo['cpp'] == 'bool'
+
+
+def get_column_types(method_list, tree_info, class_infos):
+    """Get array typecode & whether values are bools for each method, see get_column_typecode()
+
+    Returns
+    -------
+    OrderedDict[str, (str, bool)]
+    """
+    return OrderedDict((method, get_column_typecode(method, tree_info, class_infos))
+                       for method in method_list)
+
+
+def fits_dtype(values, dtype):
+    """Check if numpy array can be converted to dtype without losing values.
+
+    Allows e.g. double values for a float column, and ints for an int column of
+    a different width if they are in range, but not floats into an int column,
+    or numbers into a string column.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+    dtype : numpy.dtype
 
-    Taken from https://goshippo.com/blog/measure-real-size-any-python-object/
+    Returns
+    -------
+    bool
     """
-    size = sys.getsizeof(obj)
-    if seen is None:
-        seen = set()
-    obj_id = id(obj)
-    if obj_id in seen:
-        return 0
-    # Important mark as seen *before* entering recursion to gracefully handle
-    # self-referential objects
-    seen.add(obj_id)
-    if isinstance(obj, dict):
-        size += sum([get_size(v, seen) for v in obj.values()])
-        size += sum([get_size(k, seen) for k in obj.keys()])
-    elif hasattr(obj, '__dict__'):
-        size += get_size(obj.__dict__, seen)
-    elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, bytearray)):
-        size += sum([get_size(i, seen) for i in obj])
-    return size
+    if not np.can_cast(values.dtype, dtype, 'same_kind'):
+        return False
+    if dtype.kind in 'iu' and values.dtype.kind in 'iu' and len(values) > 0:
+        info = np.iinfo(dtype)
+        return info.min <= values.min() and values.max() <= info.max
+    return True
+
 
+class ColumnAccumulator(object):
 
-def flatten_ntuple_write(input_filename, tree_name, output_filename, class_json_filename=None, verbose=False):
+    """Growable buffer holding all values for one method, in compact form.
+
+    Numeric values are stored in an array.array of the given typecode,
+    strings as utf-8 bytes plus offsets. If values don't fit the expected type,
+    falls back to storing a list of python objects.
+
+    Optionally the number of values in each event is also stored in `counts`.
+
+    The memory used by the stored values is given by `nbytes`, which is cheap
+    to get as it doesn't need to visit each value.
+    """
+
+    def __init__(self, typecode=None, is_bool=False, record_counts=False):
+        """
+        Parameters
+        ----------
+        typecode : str, optional
+            array typecode, or STRING_TYPECODE. If None, use a list.
+        is_bool : bool, optional
+            If True, values are bools
+        record_counts : bool, optional
+            If True, store the number of values in each event, see end_event()
+        """
+        self.typecode = typecode
+        self.is_bool = is_bool
+        self.values = []
+        self.offsets = None
+        if typecode == STRING_TYPECODE:
+            self.values = bytearray()
+            self.offsets = array('l', [0])
+        elif typecode is not None:
+            self.values = array(typecode)
+        self.counts = array('i') if record_counts else None
+        self._n_before_event = 0
+        self._list_nbytes = 0  # size of python objects, if stored as a list
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes used to store the values (and counts)"""
+        if self.typecode == STRING_TYPECODE:
+            nbytes = len(self.values) + len(self.offsets) * self.offsets.itemsize
+        elif self.typecode is not None:
+            nbytes = len(self.values) * self.values.itemsize
+        else:
+            nbytes = self._list_nbytes + len(self.values) * 8  # 8 for each pointer in the list
+        if self.counts is not None:
+            nbytes += len(self.counts) * self.counts.itemsize
+        return nbytes
+
+    def _extend_list(self, values):
+        values = list(values)
+        self._list_nbytes += sum(sys.getsizeof(v) for v in values)
+        self.values.extend(values)
+
+    def end_event(self):
+        """Record the number of values added since the last call"""
+        n_values = len(self)
+        self.counts.append(n_values - self._n_before_event)
+        self._n_before_event = n_values
+
+    def __len__(self):
+        if self.typecode == STRING_TYPECODE:
+            return len(self.offsets) - 1
+        return len(self.values)
+
+    def _to_list(self):
+        """Convert to list storage, e.g. if values aren't of the expected type"""
+        values = self.to_list()
+        self.typecode = None
+        self.offsets = None
+        self.values = []
+        self._list_nbytes = 0
+        self._extend_list(values)
+
+    def _fits_typecode(self, values):
+        """Check if numpy array can be converted to our typecode without losing values.
+
+        Allows e.g. the double & long buffers from the compiled method chains for
+        float & int columns, see fits_dtype().
+        """
+        return fits_dtype(values, np.dtype(self.typecode))
+
+    def extend(self, values):
+        if isinstance(values, np.ndarray):
+            if self.typecode not in [None, STRING_TYPECODE] and self._fits_typecode(values):
+                # bulk copy of the raw bytes, no python objects made
+                data = values.astype(self.typecode, copy=False).tobytes()
+                (getattr(self.values, 'frombytes', None) or self.values.fromstring)(data)
+                return
+            values = values.tolist()
+        if self.typecode == STRING_TYPECODE:
+            values = list(values)
+            if not all(isinstance(v, (str, bytes)) for v in values):
+                self._to_list()
+                self._extend_list(values)
+                return
+            for v in values:
+                self.values.extend(v if isinstance(v, bytes) else v.encode('utf-8'))
+                self.offsets.append(len(self.values))
+        elif self.typecode is not None:
+            values = list(values)
+            try:
+                self.values.extend(values)
+            except (TypeError, OverflowError):
+                self._to_list()
+                self._extend_list(values)
+        else:
+            self._extend_list(values)
+
+    def append(self, value):
+        self.extend([value])
+
+    def merge(self, other):
+        """Add all values from another ColumnAccumulator"""
+        if self.typecode is not None and self.typecode == other.typecode:
+            if self.typecode == STRING_TYPECODE:
+                start = self.offsets[-1]
+                self.values.extend(other.values)
+                self.offsets.extend(start + x for x in other.offsets[1:])
+            else:
+                self.values.extend(other.values)
+        else:
+            self.extend(other.to_list())
+        if self.counts is not None and other.counts is not None:
+            self.counts.extend(other.counts)
+        self._n_before_event = len(self)
+
+    def to_list(self):
+        """Get values as a list of python objects"""
+        if self.typecode == STRING_TYPECODE:
+            return [self.values[self.offsets[i]:self.offsets[i+1]].decode('utf-8')
+                    for i in range(len(self.offsets) - 1)]
+        if self.is_bool and self.typecode is not None:
+            return [bool(v) for v in self.values]
+        return list(self.values)
+
+    def to_numpy(self):
+        """Get values as numpy array. This is a view on the numeric buffer (no copy),
+        so is only valid while this object is unchanged."""
+        if self.typecode is None or self.typecode == STRING_TYPECODE:
+            return np.array(self.to_list())
+        data = np.frombuffer(self.values, dtype=self.values.typecode) if len(self.values) else np.array([], dtype=self.values.typecode)
+        if self.is_bool:
+            data = data.view(np.bool_)
+        return data
+
+
+class TreeDumper(object):
+
+    """Evaluates all methods on a range of entries in a tree,
+    storing the values for each method as one long column"""
+
+    def __init__(self, tree, tree_info, class_infos, method_list, use_cpp=False, verbose=False,
+                 profile=False, record_counts=False):
+        """
+        Parameters
+        ----------
+        tree : ROOT.TTree
+        tree_info : list[BranchInfo]
+            List with info about branch collections in tree
+        class_infos : dict
+            Dict with info about methods for classes
+        method_list : list[str]
+            List of chained methods to evaluate
+        use_cpp : bool, optional
+            If True, evaluate method chains with JIT-compiled C++ where possible
+        verbose : bool, optional
+            If True, printout extra info
+        profile : bool, optional
+            If True, record timing for each method & collection in self.profile
+        record_counts : bool, optional
+            If True, also store the number of values per event for each method,
+            see ColumnAccumulator.counts
+        """
+        self.tree = tree
+        self.method_list = method_list
+        self.record_counts = record_counts
+
+        # Figure out how to store each method's values
+        self.column_types = get_column_types(method_list, tree_info, class_infos)
+
+        # Only read the branches we need
+        self.branches = [tree.GetBranch(name) for name in get_branch_names(method_list)]
+        cache_size = setup_tree_cache(tree, self.branches)
+        if verbose:
+            print("Reading", len(self.branches), "branches, with TTreeCache of", cache_size, "bytes")
+
+        self.compiled_chains = None
+        if use_cpp:
+            self.compiled_chains = compile_method_chains(method_list, tree_info, class_infos)
+            if verbose:
+                print(len(self.compiled_chains), "method chains compiled to C++")
+
+        # Prefix tree of accessors for all methods evaluated in python
+        self.method_trie = build_method_trie([m for m in method_list
+                                              if not (self.compiled_chains and m in self.compiled_chains)])
+
+        self.profile = None
+        if profile:
+            self.profile = DumpProfile()
+            profile_method_trie(self.method_trie, self.profile)
+
+    def dump(self, entries, progress_bar=False):
+        """Get values for all methods for some entries
+
+        Parameters
+        ----------
+        entries : numpy.ndarray, list[int]
+            Entry numbers, in increasing order
+        progress_bar : bool, optional
+            If True, show a progress bar (on TTY only)
+
+        Returns
+        -------
+        OrderedDict[str, ColumnAccumulator]
+            All values for each method
+        """
+        # store all values for each method call
+        tree_data = OrderedDict((method, ColumnAccumulator(*col_type, record_counts=self.record_counts))
+                                for method, col_type in self.column_types.items())
+
+        # Use tqdm for nice progressbar, disable on non-TTY
+        for ind in tqdm(entries, disable=None if progress_bar else True):
+            this_data = get_data(self.tree, int(ind), self.method_list,
+                                 self.compiled_chains, self.method_trie, self.branches,
+                                 self.profile)
+            # flatten all events into one long list per method, makes for a much
+            # more compact output, we don't care about individual events
+            # guess we could compare those events with the same number of entries
+            # in both files? i.e. 1 or 0, but hard to do for
+            # eg jets, in which jet #1 may not be the same object in both files
+            # don't use items() as not iterator in python2
+            for key in this_data:
+                # may be a single scalar, or iterable - use extend where possible
+                try:
+                    _ = iter(this_data[key])
+                    tree_data[key].extend(this_data[key])
+                except TypeError:
+                    tree_data[key].append(this_data[key])
+            if self.record_counts:
+                for column in tree_data.values():
+                    column.end_event()
+        if self.profile is not None:
+            self.profile.add_values(tree_data)
+        return tree_data
+
+
+# Each worker process has its own TFile & TreeDumper, setup by _init_dump_worker
+_worker_state = {}
+
+
+def _init_dump_worker(input_filename, tree_name, tree_info, class_infos, method_list, use_cpp,
+                      profile=False, record_counts=False):
+    f_in, tree = open_tree(input_filename, tree_name)
+    _worker_state['file'] = f_in
+    _worker_state['dumper'] = TreeDumper(tree, tree_info, class_infos, method_list, use_cpp=use_cpp,
+                                         profile=profile, record_counts=record_counts)
+
+
+def _dump_worker_shard(shard):
+    """Returns the data for this shard, and the DumpProfile for it (None if not profiling)"""
+    dumper = _worker_state['dumper']
+    shard_data = dumper.dump(shard)
+    shard_profile = None
+    if dumper.profile is not None:
+        # each shard's profile is sent back separately, and merged in the main process
+        shard_profile = DumpProfile()
+        shard_profile.merge(dumper.profile)
+        dumper.profile.clear()
+    return shard_data, shard_profile
+
+
+def get_mp_context():
+    """Get multiprocessing context that starts fresh processes,
+    so each has its own ROOT interpreter"""
+    try:
+        return multiprocessing.get_context("spawn")
+    except AttributeError:
+        # python 2 only has fork
+        return multiprocessing
+
+
+class EventLevels(object):
+
+    """Groups methods that have the same number of values in every event into "levels",
+    e.g. all slimmedJets.xxx() methods that return one value per jet,
+    so that only one array of per-event offsets is needed for each level.
+
+    Methods from different collections are never grouped together.
+    Data can be added in chunks of events: if a method's counts stop matching
+    the rest of its level, it is split off into a new level.
+    """
+
+    def __init__(self):
+        self.levels = OrderedDict()  # level name: counts for every event so far
+        self.method_levels = OrderedDict()  # method: level name
+        self.n_events = 0
+
+    def _new_level_name(self, collection):
+        name = collection
+        ind = 1
+        while name in self.levels:
+            name = "%s_%d" % (collection, ind)
+            ind += 1
+        return name
+
+    def add(self, tree_data):
+        """Add counts for a chunk of events
+
+        Parameters
+        ----------
+        tree_data : dict[str, ColumnAccumulator]
+            Columns for chunk, with counts
+        """
+        groups = OrderedDict()
+        for method, column in tree_data.items():
+            key = (self.method_levels.get(method), method.split(".")[0], column.counts.tobytes())
+            groups.setdefault(key, []).append(method)
+
+        n_chunk_events = 0
+        used_levels = set()
+        for (level, collection, _), methods in groups.items():
+            counts = tree_data[methods[0]].counts
+            n_chunk_events = len(counts)
+            if level is not None and level not in used_levels:
+                self.levels[level].extend(counts)
+                used_levels.add(level)
+                continue
+            # Either new methods, or ones that no longer match the rest of their level
+            if level is not None:
+                previous = self.levels[level][:self.n_events]
+            else:
+                previous = array('i', [0] * self.n_events)
+            new_level = self._new_level_name(collection)
+            self.levels[new_level] = previous + counts
+            used_levels.add(new_level)
+            for method in methods:
+                self.method_levels[method] = new_level
+        self.n_events += n_chunk_events
+
+    def get_offsets(self, level):
+        """Get offsets for a level, i.e. values for event i are values[offsets[i]:offsets[i+1]]
+
+        Returns
+        -------
+        numpy.ndarray
+            int32 array of length (number of events + 1)
+        """
+        offsets = np.zeros(len(self.levels[level]) + 1, dtype=np.int32)
+        np.cumsum(np.frombuffer(self.levels[level], dtype=np.int32), out=offsets[1:])
+        return offsets
+
+
+def get_metadata_filename(dump_filename):
+    """Get filename of metadata sidecar file for a dump file that can't store
+    metadata itself, e.g. data_new.awkd -> data_new.meta.json
+    """
+    return os.path.splitext(dump_filename)[0] + ".meta.json"
+
+
+class AwkdWriter(object):
+
+    """Save tree data to awkward array table.
+
+    The format cannot be appended to, so all data are kept until close().
+    It also has no space for metadata, so that is saved to a JSON file alongside,
+    see get_metadata_filename().
+    """
+
+    can_stream = False
+
+    def __init__(self, output_filename, metadata=None):
+        import awkward
+        check_awkward_version(awkward)
+        self.awkward = awkward
+        self.output_filename = output_filename
+        self.metadata = metadata
+        self.tree_data = OrderedDict()
+
+    def write(self, tree_data):
+        for key in tree_data:
+            if key not in self.tree_data:
+                self.tree_data[key] = tree_data[key]
+            else:
+                self.tree_data[key].merge(tree_data[key])
+
+    def close(self):
+        # make awkward table, each column with one entry that holds all the values,
+        # save with compression
+        # If we have the number of values per event, instead make one entry per event,
+        # with columns from the same level sharing the same offsets array
+        event_levels, level_offsets = None, {}
+        if self.tree_data and all(c.counts is not None for c in self.tree_data.values()):
+            event_levels = EventLevels()
+            event_levels.add(self.tree_data)
+            level_offsets = {level: event_levels.get_offsets(level) for level in event_levels.levels}
+
+        columns = OrderedDict()
+        for key, column in self.tree_data.items():
+            if event_levels is not None:
+                if column.typecode is None or column.typecode == STRING_TYPECODE:
+                    content = self.awkward.fromiter(column.to_list())
+                else:
+                    content = column.to_numpy()
+                offsets = level_offsets[event_levels.method_levels[key]]
+                columns[key] = self.awkward.JaggedArray.fromoffsets(offsets, content)
+            elif column.typecode is None or column.typecode == STRING_TYPECODE:
+                columns[key] = self.awkward.fromiter([column.to_list()])
+            else:
+                columns[key] = self.awkward.JaggedArray.fromcounts([len(column)], column.to_numpy())
+        awkd_table = self.awkward.Table(columns)
+        self.awkward.save(self.output_filename, awkd_table, mode='w', compression=True)
+        if self.metadata:
+            with open(get_metadata_filename(self.output_filename), 'w') as jf:
+                json.dump(self.metadata, jf, indent=2, sort_keys=True)
+
+
+class Hdf5Writer(object):
+
+    """Save tree data to HDF5 file, one dataset per method.
+
+    Datasets are resizable, so data can be written in chunks of events.
+
+    If the number of values per event is stored, the per-event offsets for each level
+    (see EventLevels) are saved as int32 datasets in the "_offsets" group,
+    and the "offsets" attribute of each method's dataset gives the one to use.
+
+    Metadata are stored as JSON in the "metadata" attribute of the file.
+
+    The dtype of each dataset is taken from `column_types` (see get_column_types()),
+    or from the first chunk with values if the type is unknown.
+    Later chunks must fit that dtype, since h5py would silently convert them,
+    e.g. truncating floats in an int dataset.
+    """
+
+    can_stream = True
+
+    def __init__(self, output_filename, metadata=None, column_types=None):
+        import h5py
+        self.h5py = h5py
+        self.f = h5py.File(output_filename, "w")
+        self.metadata = metadata
+        self.column_types = column_types or {}
+        self.all_keys = []
+        self.event_levels = None
+
+    def get_dtype(self, key):
+        """Get dtype for the dataset of a method, or None if its type is unknown"""
+        typecode, is_bool = self.column_types.get(key, (None, False))
+        if typecode == STRING_TYPECODE:
+            return self.h5py.special_dtype(vlen=str)
+        if typecode is None:
+            return None
+        if is_bool:
+            return np.dtype(np.bool_)
+        return np.dtype(typecode)
+
+    def check_values(self, key, data, dtype):
+        """Check values of a method fit its dataset dtype, converting strings for h5py
+
+        Raises
+        ------
+        RuntimeError
+            If they don't fit
+        """
+        is_string = data.dtype.kind in ['U', 'S', 'O']
+        if self.h5py.check_dtype(vlen=dtype) is not None:
+            fits = is_string
+            # h5py can't store numpy unicode
+            data = data.astype(object)
+        else:
+            fits = not is_string and fits_dtype(data, dtype)
+        if not fits:
+            raise RuntimeError("Values of %s (%s) don't fit its dataset type %s, use awkward output instead"
+                               % (key, data.dtype, dtype))
+        return data
+
+    def write(self, tree_data):
+        if tree_data and all(c.counts is not None for c in tree_data.values()):
+            if self.event_levels is None:
+                self.event_levels = EventLevels()
+            self.event_levels.add(tree_data)
+
+        for key in tree_data:
+            if key not in self.all_keys:
+                self.all_keys.append(key)
+            if len(tree_data[key]) == 0:
+                # Don't create dataset yet, as we can't tell the dtype
+                continue
+            data = tree_data[key].to_numpy()
+            if key not in self.f:
+                dtype = self.get_dtype(key)
+                if dtype is None:
+                    dtype = data.dtype
+                    if dtype.kind in ['U', 'S', 'O']:
+                        # fixed-width strings can't be appended to
+                        dtype = self.h5py.special_dtype(vlen=str)
+                data = self.check_values(key, data, dtype)
+                self.f.create_dataset(key, data=data, dtype=dtype, maxshape=(None,), chunks=True,
+                                      compression="gzip", compression_opts=9)
+            else:
+                dataset = self.f[key]
+                data = self.check_values(key, data, dataset.dtype)
+                n_existing = dataset.shape[0]
+                dataset.resize((n_existing + len(data),))
+                dataset[n_existing:] = data
+
+    def close(self):
+        for key in self.all_keys:
+            if key not in self.f:
+                self.f.create_dataset(key, data=np.array([]), dtype=self.get_dtype(key),
+                                      compression="gzip", compression_opts=9)
+        if self.event_levels is not None:
+            offsets_group = self.f.create_group(OFFSETS_GROUP)
+            for level in self.event_levels.levels:
+                offsets_group.create_dataset(level, data=self.event_levels.get_offsets(level),
+                                             compression="gzip", compression_opts=9)
+            for key, level in self.event_levels.method_levels.items():
+                self.f[key].attrs['offsets'] = "%s/%s" % (OFFSETS_GROUP, level)
+        if self.metadata:
+            self.f.attrs['metadata'] = json.dumps(self.metadata, sort_keys=True)
+        self.f.close()
+
+
+# pyarrow type for values with each array typecode
+PARQUET_TYPES = {
+    'b': 'int8', 'B': 'uint8', 'h': 'int16', 'H': 'uint16', 'i': 'int32', 'I': 'uint32',
+    'l': 'int64', 'L': 'uint64', 'f': 'float32', 'd': 'float64',
+}
+
+
+class ParquetWriter(object):
+
+    """Save tree data to Parquet file, one column per method.
+
+    Each column holds lists of values: one row per chunk of events written,
+    or one row per event if the number of values per event is stored.
+    Each chunk is written as a separate row group, with each column compressed separately,
+    so readers can memory-map the file and load individual columns.
+
+    Metadata are stored as JSON under the "metadata" key of the schema metadata.
+
+    The schema is fixed when the file is opened, so the type of each column is
+    taken from `column_types` (see get_column_types()), not from the data,
+    as a column may be empty in the first chunk written.
+    """
+
+    can_stream = True
+
+    def __init__(self, output_filename, metadata=None, column_types=None):
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.output_filename = output_filename
+        self.metadata = metadata
+        self.column_types = column_types or {}
+        self.writer = None
+        self.value_types = OrderedDict()
+
+    def get_value_type(self, key):
+        """Get pyarrow type for values of a method"""
+        typecode, is_bool = self.column_types.get(key, (None, False))
+        if typecode == STRING_TYPECODE:
+            return self.pa.string()
+        if typecode is None:
+            # unknown type, assume float as for properties
+            return self.pa.float64()
+        if is_bool:
+            return self.pa.bool_()
+        return getattr(self.pa, PARQUET_TYPES[typecode])()
+
+    def make_list_array(self, key, column, value_type):
+        """Convert ColumnAccumulator to pyarrow list array, one entry per event if possible"""
+        try:
+            if column.typecode is None or column.typecode == STRING_TYPECODE:
+                values = self.pa.array(column.to_list(), type=value_type)
+            else:
+                values = self.pa.array(column.to_numpy(), type=value_type)
+        except (self.pa.ArrowException, TypeError, ValueError, OverflowError) as e:
+            raise RuntimeError("Values of %s don't fit its type %s (%s), use HDF5 or awkward output instead"
+                               % (key, value_type, e))
+        if column.counts is not None:
+            offsets = np.zeros(len(column.counts) + 1, dtype=np.int32)
+            np.cumsum(np.frombuffer(column.counts, dtype=np.int32), out=offsets[1:])
+        else:
+            offsets = np.array([0, len(values)], dtype=np.int32)
+        return self.pa.ListArray.from_arrays(self.pa.array(offsets), values)
+
+    def write(self, tree_data):
+        if self.writer is None:
+            for key in tree_data:
+                self.value_types[key] = self.get_value_type(key)
+            arrays = [self.make_list_array(key, tree_data[key], self.value_types[key])
+                      for key in tree_data]
+            event_aligned = bool(tree_data) and all(c.counts is not None for c in tree_data.values())
+            schema = self.pa.schema([self.pa.field(key, arr.type) for key, arr in zip(tree_data, arrays)],
+                                    metadata={'event_aligned': json.dumps(event_aligned),
+                                              'metadata': json.dumps(self.metadata or {}, sort_keys=True)})
+            self.writer = self.pq.ParquetWriter(self.output_filename, schema, compression='zstd')
+        else:
+            arrays = [self.make_list_array(key, tree_data[key], self.value_types[key])
+                      for key in self.value_types]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.writer.schema),
+                                row_group_size=max([len(a) for a in arrays] + [1]))
+
+    def close(self):
+        if self.writer is not None:
+            if self.metadata and hasattr(self.writer, 'add_key_value_metadata'):
+                # pick up metadata added after the first write, e.g. memory usage
+                # (only in newer pyarrow, otherwise it is as of the first write)
+                self.writer.add_key_value_metadata({'metadata': json.dumps(self.metadata, sort_keys=True)})
+            self.writer.close()
+
+
+def get_writer(output_filename, metadata=None, column_types=None):
+    """Get writer object for this output file, based on its extension.
+
+    `metadata` is a dict of info about the dump to store with it.
+    `column_types` are from get_column_types(), for formats with a fixed type for each column.
+    """
+    ext = os.path.splitext(output_filename)[1]
+    if "hdf5" in ext:
+        return Hdf5Writer(output_filename, metadata, column_types)
+    if "parquet" in ext:
+        return ParquetWriter(output_filename, metadata, column_types)
+    return AwkdWriter(output_filename, metadata)
+
+
+def flatten_ntuple_write(input_filename, tree_name, output_filename, class_json_filename=None, verbose=False,
+                         use_cpp=False, include_collections=None, exclude_collections=None, n_jobs=1,
+                         chunk_size=None, class_cache_dir=None, summary_filename=None,
+                         profile_filename=None, event_aligned=False, first_entry=0, max_entries=None,
+                         every_nth=1, sample_fraction=None, sample_seed=0, sample_branch=None,
+                         trace_memory=False):
     """Convert ntuple to flattened file with awkward array table.
     All data for a given method are output as one long list, ignoring event splitting.
 
@@ -694,77 +2105,229 @@ def flatten_ntuple_write(input_filename, tree_name, output_filename, class_json_
         If a str, output class info dicts to this file in JSON format
     verbose : bool, optional
         If True, print class info
+    use_cpp : bool, optional
+        If True, evaluate method chains with JIT-compiled C++ where possible.
+        Output is identical to the python-only method.
+    include_collections : list[str], optional
+        Only dump collections matching these (wildcard) patterns
+    exclude_collections : list[str], optional
+        Do not dump collections matching these (wildcard) patterns
+    n_jobs : int, optional
+        Number of processes to use. Entries are split into contiguous shards,
+        one per process (or one per chunk, if chunk_size is set), and the results
+        written in entry order in the same chunks as with 1 process.
+        So the datasets/columns, their values, and the HDF5 chunks & Parquet row groups
+        are identical to using 1 process. The files are not byte-identical,
+        as e.g. the memory use stored in the metadata differs between any 2 runs.
+    chunk_size : int, optional
+        If set, process and write this many entries at a time, so memory use is
+        bounded by the chunk size (times n_jobs + 1) rather than the number of entries.
+        Only for output formats that can be appended to (HDF5, Parquet).
+        Each chunk is a separate Parquet row group, so the file layout depends on chunk_size.
+    class_cache_dir : str, optional
+        Directory to cache class info & chained methods between runs, see parse_tree()
+    summary_filename : str, optional
+        If set, compute summary statistics for each method while dumping,
+        and save them to this JSON file (see columnStats.py)
+    profile_filename : str, optional
+        If set, record the time spent on each method & collection,
+        and save them to this JSON file sorted by time (see DumpProfile)
+    event_aligned : bool, optional
+        If True, also store the number of values in each event for each method,
+        so values can be compared event-by-event. In .awkd files each column then has
+        one entry per event; in .hdf5 files the per-event offsets are stored separately
+        (see Hdf5Writer). Flattened values are unchanged.
+    first_entry, max_entries, every_nth, sample_fraction, sample_seed, sample_branch : optional
+        Only dump a deterministic subset of entries, see select_entries().
+        The same options select the same entries from the ref & new ntuples.
+        They are stored in the output metadata.
+    trace_memory : bool, optional
+        If True, also trace python memory allocations in this process with tracemalloc,
+        and store the peak in the output metadata. This slows down dumping,
+        and doesn't include memory allocated by ROOT.
+        The bytes used by each column, and the peak RSS are always stored.
     """
-    f_in = ROOT.TFile(input_filename)
-    if f_in.IsZombie():
-        raise RuntimeError("Cannot open ROOT file %s" % input_filename)
-    tree = f_in.Get(tree_name)
-    check_tobj(tree)
+    if trace_memory:
+        try:
+            import tracemalloc
+        except ImportError:
+            print("tracemalloc needs python 3, not tracing memory")
+            trace_memory = False
+        else:
+            tracemalloc.start()
+
+    f_in, tree = open_tree(input_filename, tree_name)
 
-    tree_info, class_infos, method_list = parse_tree(tree)
+    tree_info, class_infos, method_list = parse_tree(tree, cache_dir=class_cache_dir)
 
     if verbose:
         print_tree_summary(tree_info, class_infos, 'tree')
+        print(CLASS_INFO_COUNTER['resolved'], "classes introspected,",
+              CLASS_INFO_COUNTER['reused'], "times reused already-introspected class")
 
-    print(tree.GetEntries(), "entries in tree")
+    n_entries = tree.GetEntries()
+    print(n_entries, "entries in tree")
     print(len(method_list), "hists in tree")
 
-    # store list of values for each method call, where each event is a dict of {method:value}
-    tree_data = defaultdict(list)
-
-    # Use tqdm for nice progressbar, disable on non-TTY
-    for ind in trange(tree.GetEntries(), disable=None):
-        this_data = get_data(tree, ind, method_list)
-        # flatten all events into one long list per method, makes for a much
-        # more compact output, we don't care about individual events
-        # guess we could compare those events with the same number of entries
-        # in both files? i.e. 1 or 0, but hard to do for
-        # eg jets, in which jet #1 may not be the same object in both files
-        # don't use items() as not iterator in python2
-        for key in this_data:
-            # may be a single scalar, or iterable - use extend where possible
-            try:
-                _ = iter(this_data[key])
-                tree_data[key].extend(this_data[key])
-            except TypeError:
-                tree_data[key].append(this_data[key])
+    entries = select_entries(tree, first_entry=first_entry, max_entries=max_entries, every_nth=every_nth,
+                             sample_fraction=sample_fraction, sample_seed=sample_seed,
+                             sample_branch=sample_branch)
+    if len(entries) != n_entries:
+        print(len(entries), "entries selected")
+    metadata = OrderedDict([
+        ('n_entries_tree', n_entries),
+        ('n_entries_dumped', len(entries)),
+        ('sampling', OrderedDict([
+            ('first_entry', first_entry),
+            ('max_entries', max_entries),
+            ('every_nth', every_nth),
+            ('sample_fraction', sample_fraction),
+            ('sample_seed', sample_seed),
+            ('sample_branch', sample_branch),
+        ])),
+    ])
+
+    if include_collections or exclude_collections:
+        method_list = filter_methods(method_list, include_collections, exclude_collections)
+        print(len(method_list), "hists selected")
+
+    writer = get_writer(output_filename, metadata, get_column_types(method_list, tree_info, class_infos))
+    if chunk_size and not writer.can_stream:
+        raise RuntimeError("Cannot write %s in chunks, use HDF5 or Parquet output instead" % output_filename)
+
+    column_stats = OrderedDict() if summary_filename else None
+
+    column_nbytes = OrderedDict((method, 0) for method in method_list)
+
+    def _write(shard_data):
+        for key in shard_data:
+            column_nbytes[key] += shard_data[key].nbytes
+        if column_stats is not None:
+            update_column_stats(column_stats, shard_data)
+        writer.write(shard_data)
+
+    profile = DumpProfile() if profile_filename else None
+
+    shards = get_entry_shards(entries, n_jobs, chunk_size)
+    n_jobs = min(n_jobs, len(shards))
+    if n_jobs > 1:
+        print("Dumping with", n_jobs, "processes")
+        pool = get_mp_context().Pool(processes=n_jobs,
+                                     initializer=_init_dump_worker,
+                                     initargs=(input_filename, tree_name, tree_info,
+                                               class_infos, method_list, use_cpp,
+                                               profile is not None, event_aligned))
+        try:
+            # Keep only n_jobs shards in flight, submitting the next one as each is written,
+            # so at most n_jobs + 1 shards are in memory, even if the workers are faster than the writer.
+            # Results are taken in the order of the shards, i.e. in entry order
+            # Without chunk_size, a single process writes everything at once,
+            # so merge the shards & do the same
+            pending = deque()
+            merged_data = None
+            shard_iter = iter(shards)
+            for shard in islice(shard_iter, n_jobs):
+                pending.append(pool.apply_async(_dump_worker_shard, (shard,)))
+            pbar = tqdm(total=len(shards), disable=None)
+            while pending:
+                shard_data, shard_profile = pending.popleft().get()
+                for shard in islice(shard_iter, 1):
+                    pending.append(pool.apply_async(_dump_worker_shard, (shard,)))
+                if shard_profile is not None:
+                    profile.merge(shard_profile)
+                if chunk_size:
+                    _write(shard_data)
+                elif merged_data is None:
+                    merged_data = shard_data
+                else:
+                    for key in merged_data:
+                        merged_data[key].merge(shard_data[key])
+                del shard_data
+                pbar.update()
+            pbar.close()
+            if merged_data is not None:
+                _write(merged_data)
+                del merged_data
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        dumper = TreeDumper(tree, tree_info, class_infos, method_list, use_cpp=use_cpp, verbose=verbose,
+                            profile=profile is not None, record_counts=event_aligned)
+        for shard in tqdm(shards, disable=None if len(shards) > 1 else True):
+            shard_data = dumper.dump(shard, progress_bar=(len(shards) == 1))
+            _write(shard_data)
+        if profile is not None:
+            profile.merge(dumper.profile)
+
+    peak_rss, peak_rss_children = get_peak_rss()
+    metadata['memory'] = OrderedDict([
+        ('total_column_bytes', sum(column_nbytes.values())),
+        ('peak_rss_bytes', peak_rss),
+        ('peak_rss_children_bytes', peak_rss_children),
+        ('tracemalloc_peak_bytes', None),
+        ('column_bytes', column_nbytes),
+    ])
+    if trace_memory:
+        metadata['memory']['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print("tree_data size:", metadata['memory']['total_column_bytes'], "bytes")
+    if verbose:
+        for key in ['peak_rss_bytes', 'peak_rss_children_bytes', 'tracemalloc_peak_bytes']:
+            if metadata['memory'][key] is not None:
+                print(key + ":", metadata['memory'][key])
+
+    if column_stats is not None:
+        save_summary(column_stats, summary_filename, n_entries=len(entries), metadata=metadata)
 
-    print("tree_data size:", get_size(tree_data))
+    if profile is not None:
+        profile.save(profile_filename)
+        print("Saved dump profile to", profile_filename)
 
     # Save JSON data
     if class_infos and class_json_filename:
         with open(class_json_filename, 'w') as jf:
             json.dump(class_infos, jf, indent=2, sort_keys=True)
 
-    is_hdf5 = "hdf5" in os.path.splitext(output_filename)[1]
-    if is_hdf5:
-        # Save to HDF5
-        import h5py
-        import numpy as np
-        with h5py.File(output_filename, "w") as f:
-            for k in tree_data:
-                f.create_dataset(k, data=np.array(tree_data[k]),
-                                 compression="gzip", compression_opts=9)
-    else:
-        # Save to awkward array
-        # make awkward table, save with compression
-        import awkward
-        # Use awkeard 0.12/13/14 as 0.15 has a bug that means it can't load()
-        # the file
-        # And awkward 1 doesn't even allow this format
-        # And the awkward 0.9 in CMSSW_10_6 is too old for this
-        major, minor, _ =  awkward.version.version_info
-        major = int(major)
-        minor = int(minor)
-        if major == 1:
-            raise ImportError("Need awkward 0.12.X, you have %s" % awkward.__version__)
-        elif minor > 14:
-            raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-        elif minor < 12:
-            raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
-
-        awkd_table = awkward.fromiter([tree_data])
-        awkward.save(output_filename, awkd_table, mode='w', compression=True)
+    writer.close()
+
+
+def write_tree_schema(input_filename, tree_name, output_filename, class_cache_dir=None,
+                      include_collections=None, exclude_collections=None):
+    """Save the branches & chained methods of a tree to JSON, without reading any entries.
+
+    Class info comes from the currently loaded libraries, so this should be run
+    in the same environment that made the ntuple.
+
+    Parameters
+    ----------
+    input_filename : str
+        Input Ntuple filename
+    tree_name : str
+        Name of TTree inside input file
+    output_filename : str
+        Output JSON filename
+    class_cache_dir : str, optional
+        Directory to cache class info & chained methods between runs, see parse_tree()
+    include_collections : list[str], optional
+        Only include collections matching these (wildcard) patterns
+    exclude_collections : list[str], optional
+        Do not include collections matching these (wildcard) patterns
+    """
+    f_in, tree = open_tree(input_filename, tree_name)
+    tree_info, class_infos, method_list = parse_tree(tree, cache_dir=class_cache_dir)
+    if include_collections or exclude_collections:
+        method_list = filter_methods(method_list, include_collections, exclude_collections)
+    print(len(method_list), "hists in tree")
+    schema = {
+        "tree_name": tree_name,
+        "branches": OrderedDict((b.name, b.classname) for b in tree_info),
+        "method_list": method_list,
+    }
+    with open(output_filename, 'w') as jf:
+        json.dump(schema, jf, indent=2)
+    f_in.Close()
 
 
 if __name__ == "__main__":
@@ -772,9 +2335,10 @@ if __name__ == "__main__":
     parser.add_argument("filename",
                         help='ROOT Ntuple filename')
 
-    output_fmts = ['.awkd', '.hdf5']
+    output_fmts = ['.awkd', '.hdf5', '.parquet']
     parser.add_argument("output",
-                        help="Output filename. Must be one of [%s] file extensions (.awkd recommended)" % ', '.join(output_fmts))
+                        help="Output filename. Must be one of [%s] file extensions (.awkd recommended), "
+                             "or .json with --schemaOnly" % ', '.join(output_fmts))
     default_tree = "AnalysisTree"
     parser.add_argument("--treeName",
                         help="Name of TTree, defaults to %s" % default_tree,
@@ -782,6 +2346,73 @@ if __name__ == "__main__":
     parser.add_argument("--classJson",
                         help="Output class info JSON filename",
                         default=None)
+    parser.add_argument("--classCacheDir",
+                        help="Directory to cache class info between runs, "
+                             "reused if the libraries & tree structure are unchanged",
+                        default=None)
+    parser.add_argument("--collections",
+                        help="Only dump these collections/branches. Wildcards are allowed",
+                        nargs="+")
+    parser.add_argument("--excludeCollections",
+                        help="Do not dump these collections/branches. Wildcards are allowed",
+                        nargs="+")
+    parser.add_argument("--jobs", "-j",
+                        help="Number of processes to use",
+                        type=int,
+                        default=1)
+    parser.add_argument("--chunkSize",
+                        help="Process & write this many entries at a time, to limit memory usage. "
+                             "Requires .hdf5 or .parquet output",
+                        type=int,
+                        default=None)
+    parser.add_argument("--summary",
+                        help="Also save summary statistics for each method to "
+                             "<output stem>.summary.json, for use with compareTreeDumps.py --summaryOnly",
+                        action='store_true')
+    parser.add_argument("--profile",
+                        help="Record time spent on each method & collection, "
+                             "and save to <output stem>.profile.json",
+                        action='store_true')
+    parser.add_argument("--eventAligned",
+                        help="Also store the number of values per event, "
+                             "to allow event-by-event comparisons",
+                        action='store_true')
+    parser.add_argument("--firstEntry",
+                        help="First entry to dump",
+                        type=int,
+                        default=0)
+    parser.add_argument("--maxEntries",
+                        help="Maximum number of entries to dump, after --everyNth & --sampleFraction",
+                        type=int,
+                        default=None)
+    parser.add_argument("--everyNth",
+                        help="Only dump every Nth entry, starting from --firstEntry",
+                        type=int,
+                        default=1)
+    parser.add_argument("--sampleFraction",
+                        help="Only dump this fraction of entries, chosen by a hash of the entry number "
+                             "(or --sampleBranch), so the same entries are chosen for every ntuple",
+                        type=float,
+                        default=None)
+    parser.add_argument("--sampleSeed",
+                        help="Seed for --sampleFraction, change to get a different subset",
+                        type=int,
+                        default=0)
+    parser.add_argument("--sampleBranch",
+                        help="Integer branch to hash for --sampleFraction instead of the entry number, "
+                             "e.g. the event number, for when the entry order differs between ntuples",
+                        default=None)
+    parser.add_argument("--traceMemory",
+                        help="Trace python memory allocations & store the peak in the output metadata. "
+                             "Slows down dumping",
+                        action='store_true')
+    parser.add_argument("--schemaOnly",
+                        help="Only save the branches & methods in the tree to the output JSON, "
+                             "without reading any entries. For use with compareTreeDumps.py --schemaOnly",
+                        action='store_true')
+    parser.add_argument("--cpp",
+                        help="Evaluate method chains using JIT-compiled C++ where possible (faster)",
+                        action='store_true')
     parser.add_argument("--verbose", "-v",
                         help="Printout extra info",
                         action='store_true')
@@ -790,9 +2421,34 @@ if __name__ == "__main__":
     if not os.path.isfile(args.filename):
         raise IOError("Cannot find filename %s" % args.filename)
 
+    if args.schemaOnly:
+        if not args.output.endswith(".json"):
+            raise IOError("Output file should be .json with --schemaOnly")
+        write_tree_schema(input_filename=args.filename, tree_name=args.treeName,
+                          output_filename=args.output, class_cache_dir=args.classCacheDir,
+                          include_collections=args.collections,
+                          exclude_collections=args.excludeCollections)
+        sys.exit(0)
+
     if not any(x in os.path.splitext(args.output)[1] for x in output_fmts):
         raise IOError("Output file should be %s" % ', '.join(output_fmts))
 
+    if args.everyNth < 1:
+        raise ValueError("--everyNth must be >= 1")
+    if args.sampleFraction is not None and not (0 < args.sampleFraction <= 1):
+        raise ValueError("--sampleFraction must be in (0, 1]")
+
     flatten_ntuple_write(input_filename=args.filename, tree_name=args.treeName,
                          output_filename=args.output, class_json_filename=args.classJson,
-                         verbose=args.verbose)
+                         verbose=args.verbose, use_cpp=args.cpp,
+                         include_collections=args.collections,
+                         exclude_collections=args.excludeCollections,
+                         n_jobs=args.jobs, chunk_size=args.chunkSize,
+                         class_cache_dir=args.classCacheDir,
+                         summary_filename=get_summary_filename(args.output) if args.summary else None,
+                         profile_filename=os.path.splitext(args.output)[0] + ".profile.json" if args.profile else None,
+                         event_aligned=args.eventAligned,
+                         first_entry=args.firstEntry, max_entries=args.maxEntries,
+                         every_nth=args.everyNth, sample_fraction=args.sampleFraction,
+                         sample_seed=args.sampleSeed, sample_branch=args.sampleBranch,
+                         trace_memory=args.traceMemory)
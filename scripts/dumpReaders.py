@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+
+"""Read tree dumps made by dumpNtuple.py one column (i.e. method) at a time.
+
+Each format has a reader with the same interface, see ColumnReader,
+so that only the column currently being used needs to be in memory.
+"""
+
+
+from __future__ import print_function
+
+import os
+import numpy as np
+
+
+# HDF5 group holding the per-event offsets, see dumpNtuple.Hdf5Writer
+OFFSETS_GROUP = "_offsets"
+
+
+def check_awkward_version(awkward):
+    """Check we have a version of awkward that can save & load .awkd files.
+
+    Use awkward 0.12/13/14 as 0.15 has a bug that means it can't load() the file.
+    And awkward 1 doesn't even allow this format.
+    And the awkward 0.9 in CMSSW_10_6 is too old for this.
+    """
+    major, minor, _ =  awkward.version.version_info
+    major = int(major)
+    minor = int(minor)
+    if major == 1:
+        raise ImportError("Need awkward 0.12.X, you have %s" % awkward.__version__)
+    elif minor > 14:
+        raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
+    elif minor < 12:
+        raise ImportError("Need awkward 0.12 / 0.13 / 0.14, you have %s" % awkward.__version__)
+
+
+def _strings_to_bytes(values):
+    """Convert strings to list of utf-8 bytes, as awkward uses for strings"""
+    return [v if isinstance(v, bytes) else v.encode('utf-8') for v in values]
+
+
+class ColumnReader(object):
+
+    """Base class for reading columns from a dump. On its own, it is an empty dump.
+
+    The method names are in `columns`. Use get_column() to get all the values
+    for one method, flattened over events, and release() once they are no longer needed.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self._column_set = set()
+
+    def _set_columns(self, columns):
+        self.columns = list(columns)
+        self._column_set = set(self.columns)
+
+    def __contains__(self, key):
+        return key in self._column_set
+
+    def get_column(self, key):
+        """Get all values for one method, flattened over events
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        numpy.ndarray, or list[bytes] for strings
+        """
+        return np.array([])
+
+    def release(self, key):
+        """Free any memory held for a column"""
+        pass
+
+    def close(self):
+        pass
+
+
+class Hdf5Dump(ColumnReader):
+
+    """Read columns from a HDF5 dump. Each column is only read from disk when requested."""
+
+    def __init__(self, filename):
+        super(Hdf5Dump, self).__init__()
+        import h5py
+        self.f = h5py.File(filename, "r")
+        self._set_columns(k for k in self.f.keys() if k != OFFSETS_GROUP)
+
+    def get_column(self, key):
+        values = self.f[key][()]
+        if values.dtype.kind in ['O', 'S', 'U']:
+            # h5py gives str or bytes depending on its version
+            return _strings_to_bytes(values.tolist())
+        return values
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetDump(ColumnReader):
+
+    """Read columns from a Parquet dump.
+
+    The file is memory-mapped, and only the requested column is read,
+    so numerical values are a view onto the file where possible.
+    """
+
+    def __init__(self, filename):
+        super(ParquetDump, self).__init__()
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.parquet_file = pyarrow.parquet.ParquetFile(filename, memory_map=True)
+        self._set_columns(self.parquet_file.schema_arrow.names)
+
+    def get_column(self, key):
+        column = self.parquet_file.read(columns=[key]).column(0)
+        values = column.combine_chunks().flatten()
+        if self.pa.types.is_string(values.type):
+            return _strings_to_bytes(values.to_pylist())
+        return values.to_numpy(zero_copy_only=False)
+
+
+class AwkdDump(ColumnReader):
+
+    """Read columns from an awkward array table dump.
+
+    The awkward 0.x .awkd format has no way to load a single column,
+    so the whole table is loaded on opening. Each column is then dropped from it
+    by release(), so the memory used goes down as the columns are processed.
+    Values are a view onto the column contents, not a copy.
+    """
+
+    def __init__(self, filename):
+        super(AwkdDump, self).__init__()
+        import awkward
+        check_awkward_version(awkward)
+        self.table = awkward.load(filename)
+        self._set_columns(self.table.columns)
+
+    def close(self):
+        # The whole table is in memory, so drop it
+        self.table = None
+
+    def get_column(self, key):
+        column = self.table[key]
+        if len(column) == 0:
+            return np.array([])
+        return column.flatten()
+
+    def release(self, key):
+        if key in self.table.columns:
+            del self.table[key]
+
+
+def open_dump(filename):
+    """Open dump file made by dumpNtuple.py, for reading one column at a time
+
+    Parameters
+    ----------
+    filename : str
+        .hdf5, .parquet, or .awkd file. If None, returns an empty dump.
+
+    Returns
+    -------
+    ColumnReader
+
+    Raises
+    ------
+    IOError
+        If the file type is not supported
+    """
+    if filename is None:
+        return ColumnReader()
+    ext = os.path.splitext(filename)[1]
+    if "hdf5" in ext:
+        return Hdf5Dump(filename)
+    if "parquet" in ext:
+        return ParquetDump(filename)
+    if "awkd" in ext:
+        return AwkdDump(filename)
+    raise IOError("Input must be .hdf5, .parquet, or .awkd: %s" % filename)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+
+"""Choose which tree entries to dump, and split them into shards for parallel dumping.
+
+Only needs numpy, and the tree's GetEntries() & GetBranch() methods,
+so can be used & tested without ROOT.
+"""
+
+
+from __future__ import print_function
+
+import numpy as np
+
+
+def hash_sample_mask(keys, fraction, seed=0):
+    """Decide which entries to keep by hashing a key for each one,
+    e.g. its entry number or event number.
+
+    The same keys, fraction & seed always give the same decision,
+    independent of the platform & python version, so the ref & new ntuples
+    are sampled identically.
+
+    Parameters
+    ----------
+    keys : numpy.ndarray
+        Integer key for each entry
+    fraction : float
+        Fraction of entries to keep, between 0 and 1
+    seed : int, optional
+        Use a different seed to get a different subset
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean mask, True for entries to keep
+    """
+    # splitmix64 finaliser, wraps around on overflow
+    with np.errstate(over='ignore'):
+        z = keys.astype(np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    # top 53 bits as uniform number in [0, 1)
+    return (z >> np.uint64(11)).astype(np.float64) / float(2**53) < fraction
+
+
+def get_branch_keys(tree, entries, branch_name):
+    """Get integer value of a simple branch (e.g. event number) for each entry,
+    only reading that branch
+
+    Parameters
+    ----------
+    tree : ROOT.TTree
+    entries : numpy.ndarray
+    branch_name : str
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    branch = tree.GetBranch(branch_name)
+    if not branch:
+        raise RuntimeError("No branch %s in tree to use for sampling" % branch_name)
+    keys = np.empty(len(entries), dtype=np.int64)
+    for ind, entry in enumerate(entries):
+        branch.GetEntry(int(entry))
+        keys[ind] = int(getattr(tree, branch_name))
+    return keys
+
+
+def select_entries(tree, first_entry=0, max_entries=None, every_nth=1,
+                   sample_fraction=None, sample_seed=0, sample_branch=None):
+    """Get entry numbers to dump, as a deterministic subset of the tree.
+
+    Starting from first_entry, every_nth entry is taken. Of those, a fraction
+    sample_fraction are kept, based on a hash of the entry number or the value
+    of sample_branch (see hash_sample_mask()). Then only the first max_entries
+    of what remains are kept.
+
+    Parameters
+    ----------
+    tree : ROOT.TTree
+    first_entry : int, optional
+    max_entries : int, optional
+        Maximum number of entries to return, if None no limit
+    every_nth : int, optional
+    sample_fraction : float, optional
+        If None, no hash-based sampling
+    sample_seed : int, optional
+    sample_branch : str, optional
+        Branch with an integer to hash for sampling, e.g. the event number,
+        so the same events are chosen even if the entry order differs.
+        If None, hash the entry number.
+
+    Returns
+    -------
+    numpy.ndarray
+        Entry numbers in increasing order
+    """
+    entries = np.arange(first_entry, tree.GetEntries(), every_nth, dtype=np.int64)
+    if sample_fraction is not None:
+        keys = entries if sample_branch is None else get_branch_keys(tree, entries, sample_branch)
+        entries = entries[hash_sample_mask(keys, sample_fraction, sample_seed)]
+    if max_entries is not None:
+        entries = entries[:max_entries]
+    return entries
+
+
+def get_entry_shards(entries, n_shards, chunk_size=None):
+    """Split entries into contiguous shards.
+
+    If chunk_size is set, each shard has (at most) chunk_size entries,
+    otherwise split into n_shards shards as evenly as possible.
+
+    Parameters
+    ----------
+    entries : numpy.ndarray
+        Entry numbers
+    n_shards : int
+    chunk_size : int, optional
+
+    Returns
+    -------
+    list[numpy.ndarray]
+        Entry numbers for each shard
+    """
+    n_entries = len(entries)
+    if chunk_size:
+        return [entries[first:first + chunk_size]
+                for first in range(0, n_entries, chunk_size)] or [entries]
+    n_shards = max(1, min(n_shards, n_entries))
+    shards = []
+    first = 0
+    for ind in range(n_shards):
+        last = first + (n_entries // n_shards) + (1 if ind < (n_entries % n_shards) else 0)
+        shards.append(entries[first:last])
+        first = last
+    return shards
@@ -0,0 +1,29 @@
+#!/usr/bin/env bash
+
+# Compare which collections & methods exist in the new & ref ntuples,
+# using the tree schema JSONs saved by cmsrun_jobs.py, without reading any entries.
+# Much quicker than the full comparison, so gives an early report of added/removed collections.
+
+REPORTFILE="schema_report.md"
+rm -f "$REPORTFILE"
+
+args=""
+for newschema in ${TESTDIR}/schema_*_new.json;
+do
+    echo $newschema
+    refschema=${newschema/_new.json/_ref.json}
+    # Get sample name from filename
+    name=$(basename "$newschema")
+    name=${name/schema_/}
+    name=${name/_new.json/}
+    if [ -f "$refschema" ]; then
+        time python ${CI_PROJECT_DIR}/scripts/compareTreeDumps.py "$newschema" --compareTo "$refschema" --schemaOnly --json "schemaComparison_${name}.json"
+        args="$args --json schemaComparison_${name}.json --label ${name}"
+    else
+        echo "Cannot find matching file $refschema"
+    fi
+done
+echo "args: $args"
+if [ -n "$args" ]; then
+    ${CI_PROJECT_DIR}/scripts/makeNtupleComparisonTable.py $args >> "$REPORTFILE"
+fi
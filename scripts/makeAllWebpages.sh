@@ -21,6 +21,7 @@ do
     args="$args --plotjson plots_${name}.json --plotdir plots_${name} \
                 --timingrefjson timing_${name}_ref.json --timingnewjson timing_${name}_new.json \
                 --sizerefjson size_${name}_ref.json --sizenewjson size_${name}_new.json \
+                --dumpprofilejson dumpprofile_${name}_new.json \
                 --label ${name}"
 done
 echo "args: "$args
@@ -22,10 +22,44 @@ def get_number_safely(idict, key):
     return int(entry['number'])
 
 
+def get_most_severe(idict, n):
+    """Get the methods with the most severe differences,
+    using the metrics stored by compareTreeDumps.py
+
+    Parameters
+    ----------
+    idict : dict
+        Contents of JSON file
+    n : int
+        Maximum number of methods to return
+
+    Returns
+    -------
+    list[(str, str, dict)]
+        Method name, status, & metrics, most severe first.
+        Methods with 0 severity are not included.
+    """
+    method_status = {}
+    for status_name, status_entry in idict['comparison'].items():
+        for method in status_entry['names']:
+            method_status[method] = status_name
+    # Older JSON files don't have metrics
+    metrics = idict.get('metrics', {})
+    ranked = sorted(metrics.items(), key=lambda x: x[1]['severity'], reverse=True)
+    return [(method, method_status.get(method, ""), m) for method, m in ranked[:n] if m['severity'] > 0]
+
+
+def format_metric(value, fmt="%.3g"):
+    return "-" if value is None else fmt % value
+
+
 def main(in_args):
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("--json", help="Input JSON plot file", action='append')
     parser.add_argument("--label", help="Label for given plot file.", action='append')
+    parser.add_argument("--mostSevere",
+                        help="Also list this many methods with the most severe differences for each label",
+                        type=int, default=0)
     args = parser.parse_args(in_args)
 
     if len(args.json) != len(args.label):
@@ -57,18 +91,18 @@ def main(in_args):
             status_descriptions[status_name] = status_entry['description']
 
     all_statuses = sorted(list(set(all_statuses)))
-    # want last col to be "same" as least interesting
-    if 'SAME' in all_statuses:
-        all_statuses.insert(len(all_statuses), all_statuses.pop(all_statuses.index('SAME')))
+    # want last cols to be "rounding only", "same" & "identical" as least interesting
+    for status in ['ROUNDING_ONLY', 'SAME', 'IDENTICAL']:
+        if status in all_statuses:
+            all_statuses.append(all_statuses.pop(all_statuses.index(status)))
 
-    # bit hacky as we want to put DIFF_MEAN_RMS earliest
+    # bit hacky as we want to put DIFF_MEAN_RMS & DIFF_SHAPE earliest
     all_statuses_mod = all_statuses[:]
-    if 'DIFF_MEAN_RMS' in all_statuses:
-        all_statuses_mod.remove("DIFF_MEAN_RMS")
-
     fields = ['name', 'total_#_hists', 'added_collections', 'added_hists', 'removed_collections', 'removed_hists']
-    if 'DIFF_MEAN_RMS' in all_statuses:
-        fields.insert(2, 'DIFF_MEAN_RMS')
+    for status in ['DIFF_SHAPE', 'DIFF_MEAN_RMS']:
+        if status in all_statuses:
+            all_statuses_mod.remove(status)
+            fields.insert(2, status)
     fields.extend(all_statuses_mod)  # fields is used for keys for later string formatting, determines order of columns
 
     # Print out column headings using fields
@@ -98,6 +132,23 @@ def main(in_args):
         print(" - **{name}**: {description}".format(name=s.replace("_", " ").lower(), description=status_descriptions[s]))
     print("\n")
 
+    if args.mostSevere > 0:
+        for label in sorted(list(input_data.keys())):
+            most_severe = get_most_severe(input_data[label], args.mostSevere)
+            if not most_severe:
+                continue
+            print("**%s**: most severe differences\n" % label)
+            print("| method | status | severity | KS distance | chi2 / ndf | max quantile diff [RMS] | equal fraction |")
+            print("| ---- | ---- | ---- | ---- | ---- | ---- | ---- |")
+            for method, status_name, m in most_severe:
+                print("| " + " | ".join([method, status_name.replace("_", " ").lower(),
+                                         format_metric(m['severity']),
+                                         format_metric(m['ks_distance']),
+                                         format_metric(m['chi2_ndf']),
+                                         format_metric(m['max_quantile_diff']),
+                                         format_metric(m['equal_fraction'], "%.4f")]) + " |")
+            print("\n")
+
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
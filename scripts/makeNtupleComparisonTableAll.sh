@@ -16,4 +16,4 @@ do
     args="$args --json ${plotfile} --label ${name}"
 done
 echo "args: $args"
-${CI_PROJECT_DIR}/scripts/makeNtupleComparisonTable.py $args >> "$REPORTFILE"
\ No newline at end of file
+${CI_PROJECT_DIR}/scripts/makeNtupleComparisonTable.py $args --mostSevere 10 >> "$REPORTFILE"
\ No newline at end of file
@@ -74,7 +74,7 @@ def get_collection_name(label):
     return label.split(".")[0].replace("()", "")
 
 
-def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail):
+def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail, check_dir=None):
     """Add a group of plots, each as a Plot object, collated by collection name
 
     Parameters
@@ -84,9 +84,14 @@ def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail):
     plot_names : list[str]
         Name of plots, e.g. ["jetsAk4CHS.jetArea()", "jetsAk8CHS.pfcand_indexs()"]
     plot_dir : str
-        Directory with plots and thumbnails
+        Directory with plots and thumbnails, as used in the HTML
     dummy_thumbnail : str
         Dummy thumbnail image filename for non-existent plots.
+        Plots may not exist e.g. for NO_ENTRIES, or if compareTreeDumps.py
+        was run with --samePlots thumbnails/none.
+    check_dir : str, optional
+        Directory with plots and thumbnails, relative to the current directory,
+        used to check which plots exist. If None, uses plot_dir.
 
     Returns
     -------
@@ -103,20 +108,25 @@ def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail):
     for col in col_names:
         group_mapping[col] = Group(this_id=col, title=col, contents=[])
 
+    check_dir = check_dir or plot_dir
+
     # Now create Plot obj, and assign to correct Group
     for plot_name in plot_names:
         this_thumbnailname = plot_name.replace("()", "") + ".gif"  # As specified in compareTreeDumps.py
-        this_thumbnailname = os.path.join(plot_dir, "thumbnails", this_thumbnailname)
+        this_thumbnailname = os.path.join("thumbnails", this_thumbnailname)
 
         this_filename = plot_name.replace("()", "") + ".pdf"  # As specified in makeAllNtupleComparisons.sh
-        this_filename = os.path.join(plot_dir, this_filename)
 
-        if group_key == "NO_ENTRIES":
-            # special case for NO_ENTRIES, as the plots don't exist...but do double check
-            if not os.path.isfile(this_thumbnailname):
-                this_thumbnailname = dummy_thumbnail
-            if not os.path.isfile(this_filename):
-                this_filename = dummy_thumbnail
+        # Not all plots are made, so fallback to the thumbnail, or a dummy thumbnail
+        caption = plot_name.replace(".", "<wbr>.")  # use <wbr> to allow line break, otherwise need spaces to wrap
+        has_thumbnail = os.path.isfile(os.path.join(check_dir, this_thumbnailname))
+        has_plot = os.path.isfile(os.path.join(check_dir, this_filename))
+        this_thumbnailname = os.path.join(plot_dir, this_thumbnailname) if has_thumbnail else dummy_thumbnail
+        this_filename = os.path.join(plot_dir, this_filename)
+        if not has_plot:
+            this_filename = this_thumbnailname
+            if group_key != "NO_ENTRIES":
+                caption += " (not plotted)" if this_thumbnailname == dummy_thumbnail else " (thumbnail only)"
 
         col = default_col
         if is_collection(plot_name):
@@ -125,8 +135,7 @@ def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail):
             Plot(this_id=plot_name,
                  thumbnailname=this_thumbnailname,
                  filename=this_filename,
-                 # use <wbr> to allow line break, otherwise need spaces to wrap
-                 caption=plot_name.replace(".", "<wbr>."),
+                 caption=caption,
                  title=plot_name,
                 )
         )
@@ -141,6 +150,10 @@ def add_plot_group(group_key, plot_names, plot_dir, dummy_thumbnail):
     return this_item
 
 
+# Maximum number of methods to show in the dump profile table
+MAX_PROFILE_METHODS = 200
+
+
 def safe_str(label):
     """Create HTML/filesystem safe str ie no spaces, etc"""
     return label.replace(" ", "_")
@@ -178,6 +191,11 @@ def main(in_args):
                         help="Input new size JSON file",
                         action='append',
                          default=[])
+    parser.add_argument("--dumpprofilejson",
+                        help="Optional input dump profile JSON file (made by dumpNtuple.py --profile). "
+                             "If given, must be given for every label, but the file need not exist",
+                        action='append',
+                        default=[])
     parser.add_argument("--label",
                         help="Label for given plot file",
                         required=True,
@@ -216,9 +234,13 @@ def main(in_args):
                            "--plotjson, plotdir, timingrefjson, timingnewjson, "
                            "sizerefjson, sizenewjson, label argument")
 
+    dump_profile_jsons = args.dumpprofilejson or [None] * len(args.label)
+    if len(dump_profile_jsons) != len(args.label):
+        raise RuntimeError("You must provide the same number of --dumpprofilejson and --label arguments")
+
     # Make page & everything for each sample
     for (plotjson, plotdir, timing_ref_json, timing_new_json,
-         size_ref_json, size_new_json, label) in zip(*all_args):
+         size_ref_json, size_new_json, label), dump_profile_json in zip(zip(*all_args), dump_profile_jsons):
 
         label_safe = safe_str(label)
         # Define this here first, since everything else will need to be relative to it
@@ -259,7 +281,8 @@ def main(in_args):
                      add_plot_group(group_key=key,
                                     plot_names=orig_plot_data[key]['names'],
                                     plot_dir=rel_figs_dir,
-                                    dummy_thumbnail=dummy_thumbnail)
+                                    dummy_thumbnail=dummy_thumbnail,
+                                    check_dir=figs_dir)
                      for key in ['added_hists', 'removed_hists']
                     ]
 
@@ -268,7 +291,8 @@ def main(in_args):
                           add_plot_group(group_key=key,
                                          plot_names=orig_plot_data['comparison'][key]['names'],
                                          plot_dir=rel_figs_dir,
-                                         dummy_thumbnail=dummy_thumbnail)
+                                         dummy_thumbnail=dummy_thumbnail,
+                                         check_dir=figs_dir)
                           for key in orig_plot_data['comparison']
                          ])
 
@@ -451,6 +475,25 @@ def main(in_args):
             size_rows = [[m] + data for m, data in zip(this_size_mod_dict['index'], this_size_mod_dict['data'])]
             size_mod_rows[colname] = size_rows
 
+        #######################################################################
+        # DUMP PROFILE
+        #######################################################################
+        # Time spent on each collection & method when dumping the new ntuple
+        profile_coll_headers, profile_coll_rows = [], []
+        profile_method_headers, profile_method_rows = [], []
+        if dump_profile_json and os.path.isfile(dump_profile_json):
+            with open(dump_profile_json) as f:
+                dump_profile_data = json.load(f, object_pairs_hook=OrderedDict)
+
+            profile_coll_headers = ['Collection name', 'Total [s]', 'Read [s]', 'Evaluate [s]', 'Events', 'Values']
+            profile_coll_rows = [[c['name'], c['time'], c['read_time'], c['eval_time'], c['events'], c['values']]
+                                 for c in dump_profile_data['collections']]
+
+            # Only show the most expensive, otherwise the page is huge
+            profile_method_headers = ['Method', 'Total [s]', 'Per call [s]', 'Calls', 'Values']
+            profile_method_rows = [[m['name'], m['time'], m['time_per_call'], m['calls'], m['values']]
+                                   for m in dump_profile_data['methods'][:MAX_PROFILE_METHODS]]
+
         #######################################################################
         # MAKE FINAL HTML
         #######################################################################
@@ -471,7 +514,11 @@ def main(in_args):
                                  size_overall_total=size_overall_total,  # do separately for own special fixed row
                                  size_overall_rows=size_overall_rows,
                                  size_mod_headers=size_mod_headers,
-                                 size_mod_data=size_mod_rows
+                                 size_mod_data=size_mod_rows,
+                                 profile_coll_headers=profile_coll_headers,
+                                 profile_coll_rows=profile_coll_rows,
+                                 profile_method_headers=profile_method_headers,
+                                 profile_method_rows=profile_method_rows
                                 )
 
         print("Writing html to", html_filename)
@@ -22,6 +22,8 @@ from itertools import chain
 from collections import OrderedDict
 from tqdm import tqdm
 import ROOT
+from stlToNumpy import stl_to_numpy
+from rootMemory import get_canvas, own_object, format_rss, RSS_TRACE_INTERVAL
 
 
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -394,7 +396,7 @@ def plot_hists(h1, stats1, h2, stats2, output_dir=".", canvas_size=(800, 600), f
         return
 
     hname = h1.GetName().replace("h1_", "") if h1 else h2.GetName().replace("h2_", "")
-    c = ROOT.TCanvas("c"+hname, "", *canvas_size)
+    c = get_canvas("cplot", *canvas_size)
     c.SetTicks(1, 1)
 
     # Check if our version of ROOT has TRatioPlot
@@ -419,10 +421,13 @@ def plot_hists(h1, stats1, h2, stats2, output_dir=".", canvas_size=(800, 600), f
         h2.SetMarkerSize(1.5)
 
     # Do final plotting
+    rp = None
     if do_ratioplot and h1 and h2:
         # Clone h1, since a bug in TRatioPlot will screw up h1
         # and change e.g. GetMean()
-        rp = ROOT.TRatioPlot(h1.Clone(ROOT.TUUID().AsString()), h2.Clone(ROOT.TUUID().AsString()))
+        h1_clone = own_object(h1.Clone(ROOT.TUUID().AsString()))
+        h2_clone = own_object(h2.Clone(ROOT.TUUID().AsString()))
+        rp = ROOT.TRatioPlot(h1_clone, h2_clone)
         rp.SetGridlines(array('d', [1.]), 1)
         # Set margins so that we can fit the stats box off the plot
         rp.SetRightMargin(0.18)
@@ -499,6 +504,11 @@ def plot_hists(h1, stats1, h2, stats2, output_dir=".", canvas_size=(800, 600), f
     output_name = os.path.join(output_dir, output_filename)
     c.SaveAs(output_name)
 
+    # Delete the ratio plot now, before the cloned hists it uses,
+    # and leave the canvas empty for reuse
+    rp = None
+    c.Clear()
+
 
 def do_ttree_draw(tree1, tree2, method_str):
     """Draw histogram(s) of variable method_str from tree1 & tree2
@@ -530,7 +540,7 @@ def do_ttree_draw(tree1, tree2, method_str):
 
     # print("TTree drawing", method_str)
     hname_clean = method_str.replace("()", "")
-    c = ROOT.TCanvas("c"+hname_clean, "", 800, 600)
+    c = get_canvas("ctmp", 800, 600)
 
     xmin, xmax = 999999999, -999999999
 
@@ -539,7 +549,7 @@ def do_ttree_draw(tree1, tree2, method_str):
         h1name_tmp = h1name + "_tmp"
         tree1.Draw(method_str + ">>" + h1name_tmp, "", "goff")
         # do it this way to let ROOT decide upon the axis range
-        h1_tmp = ROOT.TH1F(ROOT.gROOT.FindObject(h1name_tmp))
+        h1_tmp = own_object(ROOT.gROOT.FindObject(h1name_tmp))
 
         # Figure out range from ROOT hist info
         ax1 = h1_tmp.GetXaxis()
@@ -549,7 +559,7 @@ def do_ttree_draw(tree1, tree2, method_str):
     if tree2:
         h2name_tmp = h2name + "_tmp"
         tree2.Draw(method_str + ">>" + h2name_tmp, "", "goff")
-        h2_tmp = ROOT.TH1F(ROOT.gROOT.FindObject(h2name_tmp))
+        h2_tmp = own_object(ROOT.gROOT.FindObject(h2name_tmp))
         ax2 = h2_tmp.GetXaxis()
         xmin2, xmax2 = ax2.GetXmin(), ax2.GetXmax()
 
@@ -569,21 +579,26 @@ def do_ttree_draw(tree1, tree2, method_str):
     if tree1:
         h1 = ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax)
         tree1.Draw(method_str + ">>" + h1name)
+        own_object(h1)  # only after drawing, as TTree::Draw finds it by name
         h1.Draw("HIST")
         c.Update()
         # Get stat boxes for repositioning
         # Draw hist by itself to get it, then plot them together afterwards
-        stats1 = h1.GetListOfFunctions().FindObject("stats").Clone("stats1")
+        stats1 = own_object(h1.GetListOfFunctions().FindObject("stats").Clone("stats1"))
         h1.SetStats(0)
 
     if tree2:
         h2 = ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax)
         tree2.Draw(method_str + ">>" + h2name)
+        own_object(h2)
         h2.Draw("HIST")
         c.Update()
-        stats2 = h2.GetListOfFunctions().FindObject("stats").Clone("stats2")
+        stats2 = own_object(h2.GetListOfFunctions().FindObject("stats").Clone("stats2"))
         h2.SetStats(0)
 
+    # Leave the canvas empty for reuse
+    c.Clear()
+
     return h1, stats1, h2, stats2
 
 
@@ -637,6 +652,10 @@ def safe_iter(thing):
     """Return an iterable over `thing`, regardless of whether
     it is iterable or a single value
     """
+    arr = stl_to_numpy(thing)
+    if arr is not None:
+        # much faster than iterating over the vector in python
+        return iter(arr.tolist())
     try:
         return iter(thing)
     except TypeError:
@@ -741,7 +760,7 @@ def do_event_loop_hists(tree1, tree2, method_str):
     ROOT.TH1, ROOT.TPaveStats, ROOT.TH1, ROOT.TPaveStats
     """
     hname_clean = method_str.replace("()", "")
-    c = ROOT.TCanvas("ctmp"+hname_clean, "", 800, 600)
+    c = get_canvas("ctmp", 800, 600)
 
     nbins = 50
     data1 = []
@@ -766,27 +785,28 @@ def do_event_loop_hists(tree1, tree2, method_str):
     h1, stats1 = None, None
     if tree1:
         h1name = "h1_%s" % (hname_clean)
-        h1 = ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax)
+        h1 = own_object(ROOT.TH1F(h1name, ";%s;N" % method_str, nbins, xmin, xmax))
         for d in data1:
             h1.Fill(d)
         h1.Draw("HIST")
         c.Update()
         # Get stat boxes for repositioning
         # Draw hist by itself to get it, then plot them together afterwards
-        stats1 = h1.GetListOfFunctions().FindObject("stats").Clone("stats1")
+        stats1 = own_object(h1.GetListOfFunctions().FindObject("stats").Clone("stats1"))
         h1.SetStats(0)
 
     h2, stats2 = None, None
     if tree2:
         h2name = "h2_%s" % (hname_clean)
-        h2 = ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax)
+        h2 = own_object(ROOT.TH1F(h2name, ";%s;N" % method_str, nbins, xmin, xmax))
         for d in data2:
             h2.Fill(d)
         h2.Draw("HIST")
         c.Update()
-        stats2 = h2.GetListOfFunctions().FindObject("stats").Clone("stats2")
+        stats2 = own_object(h2.GetListOfFunctions().FindObject("stats").Clone("stats2"))
         h2.SetStats(0)
 
+    # Leave the canvas empty for reuse
     c.Clear()
 
     return h1, stats1, h2, stats2
@@ -1165,9 +1185,11 @@ if __name__ == "__main__":
     pbar = tqdm(all_hists, disable=None)
     max_len = max(len(l) for l in all_hists)
     fmt_str = "{0: <%d}" % (max_len+2)
-    for method_str in pbar:
+    for ind, method_str in enumerate(pbar):
         if args.verbose:
             pbar.set_description(fmt_str.format(method_str))
+            if ind % RSS_TRACE_INTERVAL == 0:
+                tqdm.write("%d hists done, %s" % (ind, format_rss()))
 
         # Make histograms
         hist1, stats1, hist2, stats2 = make_hists(tree1, tree1_info, class_infos1,
@@ -1194,6 +1216,8 @@ if __name__ == "__main__":
         hist_status[method_str] = status
 
     print(len(hist_status), "plots produced")
+    if args.verbose:
+        print(format_rss())
 
     # Save JSON data
     json_dir = os.path.dirname(args.json)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+
+
+"""Local content-addressed store of the outputs from reference cmsRun jobs,
+so they can be reused by later pipelines instead of being regenerated.
+Also used by compareTreeDumps.py to store comparison results & plots.
+
+Each entry is keyed by a hash of everything that determines its contents:
+reference commit, config, input file, number of events, CMSSW release & architecture,
+and dumper version.
+Least-recently-used entries are evicted once the store exceeds its size limit.
+
+Can also be run as a script to list & evict entries.
+"""
+
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+
+# Bump if the layout of the store changes
+CACHE_VERSION = 1
+
+ENTRY_INFO_FILENAME = "entry.json"
+
+# Files that go into the dump, or decide which cached outputs are reused,
+# so changes to them make a new dumper version
+DUMPER_FILES = ["dumpNtuple.py", "stlToNumpy.py", "columnStats.py", "entrySelection.py",
+                "dumpReaders.py", "refCache.py"]
+
+
+def get_dumper_version():
+    """Get hash of the dumpNtuple.py code, so that cached dumps are
+    regenerated whenever it changes
+
+    Returns
+    -------
+    str
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    hasher = hashlib.sha1()
+    for filename in DUMPER_FILES:
+        with open(os.path.join(script_dir, filename), 'rb') as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+def get_git_commit(repo_dir):
+    """Get commit hash of HEAD in git repo
+
+    Parameters
+    ----------
+    repo_dir : str
+
+    Returns
+    -------
+    str
+        Commit hash, or None if it can't be determined
+    """
+    try:
+        output = subprocess.check_output(["git", "-C", repo_dir, "rev-parse", "HEAD"])
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return output.decode().strip()
+
+
+def get_cache_key(ref_commit, config, input_file, max_events, dumper_version,
+                  cmssw_version=None, scram_arch=None, **kwargs):
+    """Make key for a cache entry from all the things that determine its contents
+
+    Parameters
+    ----------
+    ref_commit : str
+        Commit hash of reference code
+    config : str
+        Name of cmsRun config
+    input_file : str
+        Input MiniAOD filename
+    max_events : int
+        Number of events processed
+    dumper_version : str
+        See get_dumper_version()
+    cmssw_version : str, optional
+        CMSSW release, if None taken from $CMSSW_VERSION
+    scram_arch : str, optional
+        Architecture, if None taken from $SCRAM_ARCH
+    **kwargs
+        Anything else that changes the contents e.g. extra cmsRun options
+
+    Returns
+    -------
+    str
+    """
+    key_info = dict(kwargs, ref_commit=ref_commit, config=config, input_file=input_file,
+                    max_events=max_events, dumper_version=dumper_version,
+                    cmssw_version=cmssw_version or os.environ.get('CMSSW_VERSION'),
+                    scram_arch=scram_arch or os.environ.get('SCRAM_ARCH'),
+                    cache_version=CACHE_VERSION)
+    return hashlib.sha1(json.dumps(key_info, sort_keys=True).encode()).hexdigest()
+
+
+def get_dir_size(dirname):
+    """Get total size of all files in directory, in bytes"""
+    total = 0
+    for root, _, files in os.walk(dirname):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+class RefCache(object):
+
+    """Store of reference job outputs in a directory, one subdirectory per entry.
+
+    Each entry holds files for named roles (e.g. "ntuple", "data"), so they can be
+    restored under whatever filenames the current job uses,
+    and an entry.json with its key info, size, and last-used time.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory for the store, created if necessary
+        max_size : int, optional
+            Maximum total size in bytes, if None no limit
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_info(self, key):
+        info_filename = os.path.join(self._entry_dir(key), ENTRY_INFO_FILENAME)
+        try:
+            with open(info_filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            # missing, or partially written
+            return None
+
+    def _write_info(self, key, info):
+        info_filename = os.path.join(self._entry_dir(key), ENTRY_INFO_FILENAME)
+        tmp_filename = info_filename + ".tmp%d" % os.getpid()
+        with open(tmp_filename, 'w') as f:
+            json.dump(info, f, indent=2, sort_keys=True)
+        os.rename(tmp_filename, info_filename)
+
+    def lookup(self, key):
+        """Get info about entry, and mark it as recently used
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        dict
+            Entry info, or None if not in the store
+        """
+        info = self._read_info(key)
+        if info is None:
+            return None
+        info['last_used'] = time.time()
+        info['n_used'] = info.get('n_used', 0) + 1
+        self._write_info(key, info)
+        return info
+
+    def restore(self, key, filenames, allow_missing=False):
+        """Copy files from an entry
+
+        Parameters
+        ----------
+        key : str
+        filenames : dict[str, str]
+            Destination filename for each role
+        allow_missing : bool, optional
+            If True, roles not in the entry are skipped,
+            otherwise the entry must have all roles
+
+        Returns
+        -------
+        dict
+            Entry info if the files were restored, None if not in the store
+        """
+        # Only mark the entry as used if it can actually be restored
+        info = self._read_info(key)
+        if info is None or not (allow_missing or all(role in info['files'] for role in filenames)):
+            return None
+        info = self.lookup(key)
+        if info is None:
+            # evicted in the meantime
+            return None
+        for role, dest in filenames.items():
+            if role in info['files']:
+                shutil.copy2(os.path.join(self._entry_dir(key), info['files'][role]), dest)
+        return info
+
+    def store(self, key, filenames, key_info=None, data=None):
+        """Add an entry with copies of files, replacing any existing one.
+        Then evict old entries if the store is too large.
+
+        Parameters
+        ----------
+        key : str
+        filenames : dict[str, str]
+            Filename for each role. Roles with missing files are skipped.
+        key_info : dict, optional
+            Human-readable info about the key, for listing
+        data : dict, optional
+            Extra info to store with the entry, in info['data']
+        """
+        # Fill in a temporary directory & rename at the end,
+        # so other jobs never see a partial entry
+        tmp_dir = self._entry_dir(key) + ".tmp%d" % os.getpid()
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        files = {}
+        for role, filename in filenames.items():
+            if not os.path.isfile(filename):
+                continue
+            files[role] = os.path.basename(filename)
+            shutil.copy2(filename, os.path.join(tmp_dir, files[role]))
+        now = time.time()
+        info = {
+            'key': key,
+            'key_info': key_info or {},
+            'data': data or {},
+            'files': files,
+            'size': get_dir_size(tmp_dir),
+            'created': now,
+            'last_used': now,
+            'n_used': 0,
+        }
+        with open(os.path.join(tmp_dir, ENTRY_INFO_FILENAME), 'w') as f:
+            json.dump(info, f, indent=2, sort_keys=True)
+
+        self.evict(key)
+        try:
+            os.rename(tmp_dir, self._entry_dir(key))
+        except OSError:
+            # Another job stored the same key since the evict, keep theirs
+            if not os.path.isdir(self._entry_dir(key)):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.enforce_size_limit(keep=[key])
+
+    def list_entries(self):
+        """Get info for all entries, most recently used first
+
+        Returns
+        -------
+        list[dict]
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if ".tmp" in key or not os.path.isdir(self._entry_dir(key)):
+                continue
+            info = self._read_info(key)
+            if info is not None:
+                entries.append(info)
+        return sorted(entries, key=lambda x: x['last_used'], reverse=True)
+
+    def evict(self, key):
+        """Remove an entry, if it exists"""
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def enforce_size_limit(self, keep=None):
+        """Evict least-recently-used entries until the store is within max_size
+
+        Parameters
+        ----------
+        keep : list[str], optional
+            Keys to never evict
+
+        Returns
+        -------
+        list[str]
+            Evicted keys
+        """
+        if self.max_size is None:
+            return []
+        keep = keep or []
+        entries = self.list_entries()
+        total_size = sum(x['size'] for x in entries)
+        evicted = []
+        for entry in reversed(entries):
+            if total_size <= self.max_size:
+                break
+            if entry['key'] in keep:
+                continue
+            self.evict(entry['key'])
+            total_size -= entry['size']
+            evicted.append(entry['key'])
+        return evicted
+
+
+def print_entries(entries):
+    """Print table of cache entries"""
+    print("{0:<42} {1:>10} {2:<20} {3:>6}  {4}".format("Key", "Size [MB]", "Last used", "Uses", "Info"))
+    for entry in entries:
+        last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['last_used']))
+        info = ", ".join("%s=%s" % (k, v) for k, v in sorted(entry['key_info'].items()))
+        print("{0:<42} {1:>10.2f} {2:<20} {3:>6}  {4}".format(entry['key'], entry['size'] / 1.0E6,
+                                                              last_used, entry.get('n_used', 0), info))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("cacheDir", help="Cache directory")
+    parser.add_argument("--list", help="List all entries, most recently used first", action='store_true')
+    parser.add_argument("--evict", help="Remove these entries", nargs="+", default=[])
+    parser.add_argument("--evictAll", help="Remove all entries", action='store_true')
+    parser.add_argument("--maxSize", help="Evict least-recently-used entries until the total size is below this [GB]",
+                        type=float, default=None)
+    args = parser.parse_args()
+
+    cache = RefCache(args.cacheDir,
+                     max_size=int(args.maxSize * 1.0E9) if args.maxSize is not None else None)
+
+    keys_to_evict = args.evict
+    if args.evictAll:
+        keys_to_evict = [x['key'] for x in cache.list_entries()]
+    for key in keys_to_evict:
+        cache.evict(key)
+        print("Evicted", key)
+
+    for key in cache.enforce_size_limit():
+        print("Evicted", key)
+
+    if args.list or not (keys_to_evict or args.maxSize is not None):
+        print_entries(cache.list_entries())
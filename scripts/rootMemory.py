@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+
+"""Helpers to keep the number of ROOT objects, and so the memory use,
+bounded when making thousands of plots.
+
+By default ROOT registers each new histogram in the current directory,
+and each canvas in its list of canvases, so they are never freed
+and later lookups by name get slower. Instead we reuse one canvas
+for each purpose, and make python own the histograms, so they are
+deleted as soon as they are no longer used.
+"""
+
+
+from __future__ import print_function
+
+import os
+import ROOT
+
+
+# How often to print the RSS in verbose mode, in number of hists
+RSS_TRACE_INTERVAL = 100
+
+# Reusable canvas for each name, see get_canvas()
+_canvases = {}
+
+
+def get_canvas(name, width, height):
+    """Get a cleared canvas of the given size, reusing the one with this name if it exists
+
+    Parameters
+    ----------
+    name : str
+    width : int
+    height : int
+
+    Returns
+    -------
+    ROOT.TCanvas
+    """
+    if name not in _canvases:
+        _canvases[name] = ROOT.TCanvas(name, "", width, height)
+    c = _canvases[name]
+    c.SetCanvasSize(width, height)
+    c.Clear()
+    c.cd()
+    return c
+
+
+def own_object(obj):
+    """Remove ROOT object from any directory, and make python own it,
+    so it is deleted when no longer referenced in python
+
+    Parameters
+    ----------
+    obj : ROOT.TObject
+
+    Returns
+    -------
+    ROOT.TObject
+        The same object, for convenience
+    """
+    if hasattr(obj, "SetDirectory"):
+        obj.SetDirectory(0)
+    ROOT.SetOwnership(obj, True)
+    return obj
+
+
+def get_rss():
+    """Get current resident set size (RSS) of this process
+
+    Returns
+    -------
+    int
+        In bytes, or None if not available on this platform
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def format_rss(rss=None):
+    """Get RSS as a string for printing
+
+    Parameters
+    ----------
+    rss : int, optional
+        In bytes. If None, use the current RSS of this process.
+    """
+    if rss is None:
+        rss = get_rss()
+    return "RSS: %.1f MB" % (rss / 1.0E6) if rss is not None else "RSS: unknown"
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+
+"""Convert std::vector objects from PyROOT into numpy arrays,
+without iterating over each element in python.
+
+For numeric types the array is a view onto the vector's contiguous memory,
+so is only valid as long as the vector is not modified or deleted:
+copy it if you need to keep it.
+"""
+
+
+from __future__ import print_function
+
+import re
+import numpy as np
+import ROOT
+
+
+# numpy dtype for each numeric element type of std::vector
+VECTOR_DTYPES = {
+    "float": np.float32, "Float_t": np.float32,
+    "double": np.float64, "Double_t": np.float64, "Double32_t": np.float64,
+    "short": np.int16, "Short_t": np.int16,
+    "unsigned short": np.uint16, "UShort_t": np.uint16,
+    "int": np.int32, "Int_t": np.int32,
+    "unsigned int": np.uint32, "UInt_t": np.uint32,
+    "long": np.int64, "Long_t": np.int64, "long long": np.int64, "Long64_t": np.int64,
+    "unsigned long": np.uint64, "ULong_t": np.uint64,
+    "unsigned long long": np.uint64, "ULong64_t": np.uint64,
+}
+
+# std::vector<bool> is packed bits, so has no contiguous memory we can use.
+# Instead unpack it in one go into a reusable buffer,
+# rather than iterating in python or allocating a new vector each time
+UNPACK_VECTOR_OF_BOOL_CPP = """
+void unpackVectorBool(const std::vector<bool> & vec, std::vector<int> & out) {
+  out.assign(vec.begin(), vec.end());
+}
+"""
+ROOT.gInterpreter.Declare(UNPACK_VECTOR_OF_BOOL_CPP)
+
+_bool_buffer = ROOT.std.vector('int')()
+
+# Element type for each python type we have seen, None if not a numeric vector
+_element_types = {}
+
+
+def get_vector_element_type(thing):
+    """Get element type if `thing` is a std::vector of numbers or bools
+
+    Parameters
+    ----------
+    thing : object
+
+    Returns
+    -------
+    str
+        Element type e.g. "float", "bool", or None if not a numeric/bool vector
+    """
+    this_type = type(thing)
+    if this_type not in _element_types:
+        element_type = None
+        m = re.match(r'(?:std::)?vector<\s*([\w :]+?)\s*(?:,.*)?>$', this_type.__name__)
+        if m and (m.group(1) in VECTOR_DTYPES or m.group(1) == "bool"):
+            element_type = m.group(1)
+        _element_types[this_type] = element_type
+    return _element_types[this_type]
+
+
+def vector_to_numpy(vec, dtype):
+    """View contents of a numeric std::vector as a numpy array
+
+    Parameters
+    ----------
+    vec : ROOT.std.vector
+    dtype : numpy.dtype
+        Must correspond to the element type of vec
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    n = vec.size()
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    buf = vec.data()
+    try:
+        # newer PyROOT (cppyy) LowLevelView doesn't know its size
+        buf.reshape((n,))
+    except AttributeError:
+        try:
+            # older PyROOT buffers
+            buf.SetSize(n)
+        except AttributeError:
+            pass
+    try:
+        return np.frombuffer(buf, dtype=dtype, count=n)
+    except (TypeError, ValueError):
+        # No buffer interface, still avoid python loop
+        return np.fromiter(vec, dtype=dtype, count=n)
+
+
+def stl_to_numpy(thing):
+    """Convert `thing` to a numpy array if it is a std::vector of numbers or bools
+
+    std::vector<bool> is returned as a new 0/1 int32 array, since it is
+    unpacked via a shared buffer. The others are views onto the vector's memory.
+
+    Parameters
+    ----------
+    thing : object
+
+    Returns
+    -------
+    numpy.ndarray
+        Or None if `thing` is not a numeric/bool std::vector
+    """
+    element_type = get_vector_element_type(thing)
+    if element_type is None:
+        return None
+    if element_type == "bool":
+        ROOT.unpackVectorBool(thing, _bool_buffer)
+        # Copy, as _bool_buffer is reused (and maybe reallocated) for the next vector
+        return vector_to_numpy(_bool_buffer, np.int32).copy()
+    return vector_to_numpy(thing, VECTOR_DTYPES[element_type])
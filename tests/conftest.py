@@ -0,0 +1,8 @@
+"""Make the modules in scripts/ importable in the tests"""
+
+
+import os
+import sys
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts"))
@@ -0,0 +1,97 @@
+"""Tests for the streaming column statistics & content hashes in columnStats.py"""
+
+
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from columnStats import (ColumnStats, get_content_hash, save_summary, load_summary,
+                         SKETCH_EDGES)
+
+
+def _stats_in_chunks(values, chunk_size):
+    stats = ColumnStats()
+    for start in range(0, len(values), chunk_size):
+        stats.update(values[start:start + chunk_size])
+    return stats
+
+
+def test_chunked_mean_variance_match_numpy():
+    values = np.random.RandomState(1).normal(loc=1.0E4, scale=3., size=10001)
+    for chunk_size in [1, 7, 1000, len(values)]:
+        stats = _stats_in_chunks(values, chunk_size)
+        assert stats.count == len(values)
+        assert stats.n_finite == len(values)
+        assert stats.mean == pytest.approx(values.mean(), rel=1.0E-12)
+        assert stats.variance == pytest.approx(values.var(), rel=1.0E-9)
+        assert stats.min == values.min()
+        assert stats.max == values.max()
+
+
+def test_non_finite_counted_separately():
+    values = np.array([1., np.nan, 3., np.inf, -np.inf, 5.])
+    stats = _stats_in_chunks(values, 2)
+    assert stats.count == 6
+    assert stats.n_nan == 1
+    assert stats.n_inf == 2
+    assert stats.n_finite == 3
+    assert stats.mean == pytest.approx(3.)
+    assert (stats.min, stats.max) == (1., 5.)
+
+
+def test_sketch_counts_finite_values():
+    values = np.array([0., 1.0E-12, -2.5, 3., 1.0E15, np.nan])
+    stats = _stats_in_chunks(values, 4)
+    assert len(stats.sketch) == len(SKETCH_EDGES) + 1
+    assert stats.sketch.sum() == stats.n_finite
+
+
+def test_hash_is_chunk_invariant():
+    values = np.arange(1000, dtype=np.float32) * 0.1
+    expected = get_content_hash(values)
+    for chunk_size in [1, 3, 999]:
+        assert _stats_in_chunks(values, chunk_size).content_hash == expected
+
+
+def test_hash_independent_of_storage_width():
+    assert get_content_hash(np.array([1, -2, 3], dtype=np.int32)) == \
+        get_content_hash(np.array([1, -2, 3], dtype=np.int64))
+    assert get_content_hash(np.array([0.5, 1.5], dtype=np.float32)) == \
+        get_content_hash(np.array([0.5, 1.5], dtype=np.float64))
+
+
+def test_hash_distinguishes_large_integers():
+    assert get_content_hash(np.array([2**60 + 1])) != get_content_hash(np.array([2**60]))
+
+
+def test_hash_depends_on_order():
+    assert get_content_hash([1., 2.]) != get_content_hash([2., 1.])
+
+
+def test_string_hash_chunk_invariant():
+    values = np.array(["a", "bc", "", "d"])
+    stats = _stats_in_chunks(values, 3)
+    assert stats.is_string
+    assert stats.content_hash == get_content_hash(values)
+    # the separator means the boundaries between strings matter
+    assert get_content_hash(["ab", "c"]) != get_content_hash(["a", "bc"])
+
+
+def test_summary_round_trip(tmpdir):
+    stats = {'x': _stats_in_chunks(np.array([1., 2., 3.]), 2),
+             'y': _stats_in_chunks(np.array(["a"]), 1)}
+    filename = str(tmpdir.join("data.summary.json"))
+    save_summary(stats, filename, n_entries=3, metadata={'every_nth': 1})
+    summary = load_summary(filename)
+    assert summary['n_entries'] == 3
+    assert summary['metadata'] == {'every_nth': 1}
+    assert summary['columns']['x'] == stats['x'].to_dict()
+    assert summary['columns']['y']['is_string']
+
+
+def test_load_summary_wrong_version(tmpdir):
+    filename = tmpdir.join("old.summary.json")
+    filename.write('{"version": -1, "columns": {}}')
+    with pytest.raises(IOError):
+        load_summary(str(filename))
@@ -0,0 +1,89 @@
+"""Tests for the statistical comparison of columns in distributionMetrics.py"""
+
+
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from distributionMetrics import (HistSummary, compare_distributions, analyse_metrics,
+                                 KS_DISTANCE_LIMIT)
+
+
+SAME = HistSummary("SAME", "Histograms are the same (lowest priority)")
+DIFF_MEAN_RMS = HistSummary("DIFF_MEAN_RMS", "Differing means and/or RMS")
+
+
+@pytest.fixture
+def values():
+    return np.random.RandomState(2).normal(size=10000)
+
+
+def test_identical(values):
+    metrics = compare_distributions(values, values.copy())
+    assert metrics['equal_fraction'] == 1
+    assert metrics['sorted_equal']
+    assert metrics['ks_distance'] == 0
+    assert metrics['chi2_ndf'] == 0
+    assert metrics['max_quantile_diff'] == 0
+    assert metrics['severity'] == 0
+    assert analyse_metrics(SAME, metrics).name == "SAME"
+
+
+def test_not_comparable():
+    assert compare_distributions([], [1.]) is None
+    assert compare_distributions(np.array(["a"]), np.array(["b"])) is None
+    assert analyse_metrics(SAME, None) is SAME
+
+
+def test_rounding_only(values):
+    metrics = compare_distributions(values.astype(np.float32), values)
+    assert metrics['max_rel_diff'] < 1.0E-6
+    assert metrics['severity'] == 0
+    assert analyse_metrics(DIFF_MEAN_RMS, metrics).name == "ROUNDING_ONLY"
+
+
+def test_shape_change(values):
+    # same mean & RMS, different shape
+    reshaped = np.sign(values) * np.abs(values)**1.3
+    reshaped = (reshaped - reshaped.mean()) / reshaped.std() * values.std() + values.mean()
+    metrics = compare_distributions(reshaped, values)
+    assert metrics['ks_distance'] > KS_DISTANCE_LIMIT
+    assert metrics['chi2_ndf'] > 1
+    assert metrics['severity'] > 0
+    status = analyse_metrics(SAME, metrics)
+    assert status.name == "DIFF_SHAPE"
+    assert status.metrics is metrics
+
+
+def test_reordered(values):
+    metrics = compare_distributions(values[::-1], values)
+    assert metrics['ks_distance'] == 0
+    assert metrics['sorted_equal']
+    assert metrics['severity'] > 0
+    assert analyse_metrics(SAME, metrics).name == "DIFF_ORDER"
+
+
+def test_one_value_changed(values):
+    changed = values.copy()
+    changed[5] *= 1.23
+    metrics = compare_distributions(changed, values)
+    assert not metrics['sorted_equal']
+    assert metrics['equal_fraction'] == pytest.approx(1 - 1.0E-4)
+    assert metrics['severity'] > 0
+    assert analyse_metrics(SAME, metrics).name == "DIFF_VALUES"
+
+
+def test_different_lengths(values):
+    metrics = compare_distributions(values[:5000], values)
+    assert metrics['equal_fraction'] is None
+    assert metrics['sorted_equal'] is None
+    assert metrics['ks_distance'] is not None
+
+
+def test_non_finite():
+    metrics = compare_distributions([1., np.nan, 3.], [1., np.nan, np.inf])
+    assert metrics['equal_fraction'] == pytest.approx(2. / 3)
+    # differences involving inf are never just rounding
+    assert metrics['max_rel_diff'] is None
+    assert metrics['severity'] > 0
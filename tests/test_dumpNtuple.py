@@ -0,0 +1,53 @@
+"""Tests for dumping a tree with several processes in dumpNtuple.py"""
+
+
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+h5py = pytest.importorskip("h5py")
+from dumpNtuple import flatten_ntuple_write
+
+
+N_ENTRIES = 25
+
+
+@pytest.fixture(scope="module")
+def ntuple(tmpdir_factory):
+    """Small ntuple with a scalar and a vector branch, of different lengths in each entry"""
+    filename = str(tmpdir_factory.mktemp("ntuple").join("ntuple.root"))
+    f = ROOT.TFile(filename, "RECREATE")
+    tree = ROOT.TTree("AnalysisTree", "AnalysisTree")
+    run = np.zeros(1, dtype=np.int32)
+    tree.Branch("run", run, "run/I")
+    jet_pt = ROOT.std.vector('float')()
+    tree.Branch("jetPt", jet_pt)
+    for entry in range(N_ENTRIES):
+        run[0] = entry
+        jet_pt.clear()
+        for ind in range(entry % 4):
+            jet_pt.push_back(10. * entry + ind)
+        tree.Fill()
+    tree.Write()
+    f.Close()
+    return filename
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4])
+def test_jobs_same_as_serial(ntuple, tmpdir, chunk_size):
+    outputs = []
+    for n_jobs in [1, 2]:
+        output_filename = str(tmpdir.join("dump_%d.hdf5" % n_jobs))
+        flatten_ntuple_write(ntuple, "AnalysisTree", output_filename, n_jobs=n_jobs,
+                             chunk_size=chunk_size)
+        outputs.append(h5py.File(output_filename, "r"))
+    serial, parallel = outputs
+
+    assert sorted(serial.keys()) == sorted(parallel.keys())
+    assert len(serial["run"]) == N_ENTRIES
+    for key in serial:
+        assert serial[key].dtype == parallel[key].dtype
+        assert serial[key].chunks == parallel[key].chunks
+        assert np.array_equal(serial[key][()], parallel[key][()])
@@ -0,0 +1,73 @@
+"""Tests for the entry selection & sharding in entrySelection.py"""
+
+
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from entrySelection import hash_sample_mask, select_entries, get_entry_shards
+
+
+class FakeTree(object):
+
+    """Only has the number of entries, enough for select_entries() without a sample branch"""
+
+    def __init__(self, n_entries):
+        self.n_entries = n_entries
+
+    def GetEntries(self):
+        return self.n_entries
+
+
+def test_hash_sample_mask_deterministic():
+    keys = np.arange(10000)
+    mask = hash_sample_mask(keys, 0.3, seed=5)
+    assert np.array_equal(mask, hash_sample_mask(keys, 0.3, seed=5))
+    assert not np.array_equal(mask, hash_sample_mask(keys, 0.3, seed=6))
+    # decision for each key doesn't depend on the other keys
+    assert np.array_equal(mask[::3], hash_sample_mask(keys[::3], 0.3, seed=5))
+
+
+def test_hash_sample_mask_fraction():
+    keys = np.arange(100000)
+    assert hash_sample_mask(keys, 0.25).mean() == pytest.approx(0.25, abs=0.01)
+    assert not hash_sample_mask(keys, 0.).any()
+    assert hash_sample_mask(keys, 1.).all()
+
+
+def test_hash_sample_mask_nested():
+    # a smaller fraction selects a subset of a larger one
+    keys = np.arange(10000)
+    small = hash_sample_mask(keys, 0.1)
+    large = hash_sample_mask(keys, 0.5)
+    assert np.all(large[small])
+
+
+def test_select_entries_range():
+    tree = FakeTree(100)
+    assert np.array_equal(select_entries(tree), np.arange(100))
+    assert np.array_equal(select_entries(tree, first_entry=10, every_nth=20), [10, 30, 50, 70, 90])
+    assert np.array_equal(select_entries(tree, first_entry=95, max_entries=3), [95, 96, 97])
+
+
+def test_select_entries_sampled():
+    tree = FakeTree(1000)
+    entries = select_entries(tree, every_nth=2, sample_fraction=0.5, sample_seed=1, max_entries=50)
+    assert len(entries) == 50
+    assert np.all(entries % 2 == 0)
+    assert np.all(np.diff(entries) > 0)
+    assert np.array_equal(entries, select_entries(tree, every_nth=2, sample_fraction=0.5,
+                                                  sample_seed=1, max_entries=50))
+
+
+def test_get_entry_shards():
+    entries = np.arange(10)
+    shards = get_entry_shards(entries, 3)
+    assert [len(s) for s in shards] == [4, 3, 3]
+    assert np.array_equal(np.concatenate(shards), entries)
+
+    shards = get_entry_shards(entries, 3, chunk_size=4)
+    assert [len(s) for s in shards] == [4, 4, 2]
+
+    assert len(get_entry_shards(np.arange(0), 3, chunk_size=4)) == 1
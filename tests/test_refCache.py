@@ -0,0 +1,112 @@
+"""Tests for the content-addressed store in refCache.py"""
+
+
+from __future__ import print_function
+
+import os
+import itertools
+
+import refCache
+from refCache import RefCache, get_cache_key
+
+
+def _make_file(dirname, name, size):
+    filename = os.path.join(str(dirname), name)
+    with open(filename, 'wb') as f:
+        f.write(b'x' * size)
+    return filename
+
+
+def test_cache_key(monkeypatch):
+    key_args = dict(ref_commit="abc", config="config.py", input_file="file.root",
+                    max_events=100, dumper_version="1")
+    assert get_cache_key(**key_args) == get_cache_key(**key_args)
+    assert get_cache_key(**key_args) != get_cache_key(**dict(key_args, max_events=200))
+    assert get_cache_key(**key_args) != get_cache_key(cmdlineopt="x", **key_args)
+    assert get_cache_key(**key_args) != get_cache_key(scram_arch="slc7_amd64_gcc700", **key_args)
+
+    # the release is taken from the environment if not given
+    monkeypatch.setenv("CMSSW_VERSION", "CMSSW_10_2_10")
+    key = get_cache_key(**key_args)
+    assert key == get_cache_key(cmssw_version="CMSSW_10_2_10", **key_args)
+    monkeypatch.setenv("CMSSW_VERSION", "CMSSW_10_2_11")
+    assert key != get_cache_key(**key_args)
+
+
+def test_store_restore(tmpdir):
+    cache = RefCache(str(tmpdir.join("cache")))
+    src = _make_file(tmpdir, "ntuple.root", 10)
+    cache.store("key1", {"ntuple": src}, key_info={'config': "config.py"}, data={'a': 1})
+
+    dest = str(tmpdir.join("restored.root"))
+    info = cache.restore("key1", {"ntuple": dest})
+    assert info['data'] == {'a': 1}
+    assert info['n_used'] == 1
+    with open(dest, 'rb') as f:
+        assert f.read() == b'x' * 10
+
+    assert cache.restore("missing", {"ntuple": dest}) is None
+
+
+def test_restore_missing_role(tmpdir):
+    cache = RefCache(str(tmpdir.join("cache")))
+    src = _make_file(tmpdir, "ntuple.root", 10)
+    # roles with missing files are skipped when storing
+    cache.store("key1", {"ntuple": src, "profile": str(tmpdir.join("nonexistent.json"))})
+
+    filenames = {"ntuple": str(tmpdir.join("a.root")), "profile": str(tmpdir.join("b.json"))}
+    assert cache.restore("key1", filenames) is None
+    # an entry that can't be restored isn't marked as used
+    assert cache.list_entries()[0]['n_used'] == 0
+    assert cache.restore("key1", filenames, allow_missing=True) is not None
+    assert os.path.isfile(filenames["ntuple"])
+    assert not os.path.isfile(filenames["profile"])
+
+
+def test_concurrent_store(tmpdir):
+    cache = RefCache(str(tmpdir.join("cache")))
+    other = RefCache(cache.cache_dir)
+    evict = cache.evict
+
+    def evict_then_other_store(key):
+        # another job stores the same key between the evict & the rename
+        evict(key)
+        other.store(key, {"data": _make_file(tmpdir, "other", 10)})
+
+    cache.evict = evict_then_other_store
+    cache.store("key1", {"data": _make_file(tmpdir, "mine", 20)})
+
+    assert [x['key'] for x in cache.list_entries()] == ["key1"]
+    assert cache.lookup("key1")['files'] == {"data": "other"}
+    assert os.listdir(cache.cache_dir) == ["key1"]
+
+
+def test_lru_eviction(tmpdir, monkeypatch):
+    # make each call to time.time() later than the last, so the order of use is unambiguous
+    clock = itertools.count(1000)
+    monkeypatch.setattr(refCache.time, "time", lambda: float(next(clock)))
+
+    cache = RefCache(str(tmpdir.join("cache")))
+    for key in ["key1", "key2"]:
+        cache.store(key, {"data": _make_file(tmpdir, key, 1000)})
+    entry_size = cache.list_entries()[0]['size']
+
+    # using key1 makes key2 the least recently used
+    assert cache.lookup("key1") is not None
+    cache.max_size = 2 * entry_size
+    cache.store("key3", {"data": _make_file(tmpdir, "key3", 1000)})
+
+    keys = [x['key'] for x in cache.list_entries()]
+    assert sorted(keys) == ["key1", "key3"]
+    # most recently used first
+    assert keys == ["key3", "key1"]
+
+
+def test_enforce_size_limit_keeps(tmpdir):
+    cache = RefCache(str(tmpdir.join("cache")))
+    for key in ["key1", "key2"]:
+        cache.store(key, {"data": _make_file(tmpdir, key, 1000)})
+    cache.max_size = 0
+    evicted = cache.enforce_size_limit(keep=["key1"])
+    assert evicted == ["key2"]
+    assert [x['key'] for x in cache.list_entries()] == ["key1"]